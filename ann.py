@@ -0,0 +1,251 @@
+"""
+Approximate nearest-neighbor search over the sparse tag vectors.
+
+An inverted-file (IVF) index in pure NumPy/SciPy: the normalized vectors are
+grouped offline by spherical k-means into ~4*sqrt(N) clusters, and a query
+only rescores the rows of the `probes` clusters whose centroids are closest
+to it, instead of all N rows. (Random-projection LSH needs many more tables
+for usable recall here, since good neighbors often have a cosine of 0.3-0.5.)
+
+Stored in the bundle next to the vectors:
+
+    ann_centroids.npy  float32 (C, features)  unit-length cluster centroids
+    ann_rows.npy       int32   (N,)           catalog rows grouped by cluster
+    ann_offsets.npy    int64   (C+1,)         cluster boundaries in ann_rows
+
+The index also serves the offline build: neighbor_index() computes every
+movie's top-K list by scoring each cluster's rows only against the rows of
+its closest clusters, in about N*sqrt(N) work instead of the N^2 of the
+exact build (see `build.py --ann-neighbors`). At request time, mode=approx
+only applies to pages past the precomputed top-K.
+
+Usage:
+    python ann.py build [--clusters C] [--iterations 8]   # new bundle version with the index
+    python ann.py report [--queries 500] [--k 5]          # recall@k against exact scoring
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+from scipy import sparse
+
+from ranking import top_k, top_k_rows
+
+DEFAULT_ITERATIONS = 8
+# Clusters probed per query: at least MIN_PROBES, else this share of all clusters. A fixed count
+# lets recall fall as the catalog grows (recall@5 of 0.65 with 8 of 894 clusters on a 50k
+# synthetic catalog, 0.96 with 45)
+MIN_PROBES = 8
+PROBE_FRACTION = 0.05
+
+
+def default_clusters(n):
+    return max(1, min(n, int(4 * np.sqrt(n))))
+
+
+def default_probes(clusters):
+    return min(clusters, max(MIN_PROBES, math.ceil(PROBE_FRACTION * clusters)))
+
+
+def assign_clusters(matrix, centroids, block_size=4096):
+    """Index of the closest centroid for every row, scored a block of rows at a time"""
+    assignments = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], block_size):
+        scores = np.asarray(matrix[start:start + block_size] @ centroids.T)
+        assignments[start:start + block_size] = scores.argmax(axis=1)
+    return assignments
+
+
+class ClusterIndex:
+    """IVF index; candidates from the closest clusters are rescored exactly against the vectors"""
+
+    def __init__(self, centroids, rows, offsets):
+        self.centroids = centroids
+        self.rows = rows
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, matrix, clusters=None, iterations=DEFAULT_ITERATIONS, seed=0):
+        """Spherical k-means over the rows of a normalized CSR matrix"""
+        n = matrix.shape[0]
+        clusters = min(clusters or default_clusters(n), n)
+        rng = np.random.default_rng(seed)
+        centroids = matrix[rng.choice(n, size=clusters, replace=False)].toarray().astype(np.float32)
+
+        for _ in range(iterations):
+            assignments = assign_clusters(matrix, centroids)
+            membership = sparse.csr_matrix(
+                (np.ones(n, dtype=np.float32), (assignments, np.arange(n))), shape=(clusters, n))
+            sums = np.asarray((membership @ matrix).todense(), dtype=np.float32)
+            norms = np.linalg.norm(sums, axis=1)
+            # A cluster that lost all its members keeps its old centroid
+            filled = norms > 0
+            centroids[filled] = sums[filled] / norms[filled, None]
+
+        return cls.from_assignments(centroids, assign_clusters(matrix, centroids))
+
+    @classmethod
+    def from_assignments(cls, centroids, assignments):
+        """Group catalog rows by their cluster; rows stay in ascending order within a cluster"""
+        rows = np.argsort(assignments, kind='stable').astype(np.int32)
+        offsets = np.searchsorted(assignments[rows], np.arange(len(centroids) + 1)).astype(np.int64)
+        return cls(centroids, rows, offsets)
+
+    @classmethod
+    def from_artifacts(cls, artifacts):
+        return cls(artifacts.get('ann_centroids'), artifacts.get('ann_rows'), artifacts.get('ann_offsets'))
+
+    def extend(self, matrix, first_new):
+        """
+        Index for a catalog whose rows from first_new on were appended: the new rows join
+        their closest existing cluster and the centroids are left as they are.
+        """
+        assignments = np.empty(matrix.shape[0], dtype=np.int64)
+        assignments[self.rows] = np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+        assignments[first_new:] = assign_clusters(matrix[first_new:], self.centroids)
+        return self.from_assignments(self.centroids, assignments)
+
+    def bundle_arrays(self):
+        return {'ann_centroids': self.centroids, 'ann_rows': self.rows, 'ann_offsets': self.offsets}
+
+    @property
+    def probes(self):
+        """Default clusters probed per query for this index"""
+        return default_probes(len(self.centroids))
+
+    def candidates(self, vector, probes=None):
+        """Rows of the `probes` clusters closest to vector"""
+        closest = top_k(self.centroids @ vector, probes or self.probes)
+        return np.concatenate([self.rows[self.offsets[c]:self.offsets[c + 1]] for c in closest])
+
+    def search(self, vectors, index, k, offset=0, probes=None):
+        """
+        Approximate rows ranked offset .. offset+k-1 for catalog row `index`.
+        Falls back to exact scoring when the probed clusters hold too few candidates.
+        """
+        query = vectors.row(index)
+        candidates = self.candidates(query, probes)
+        candidates = candidates[candidates != index]
+        if len(candidates) < offset + k:
+            return top_k(vectors.similarities_to(query), k, offset=offset, exclude=index)
+
+        # Sorting keeps the stable-sort tie order of exact ranking
+        candidates.sort()
+        scores = vectors.matrix[candidates].dot(query)
+        return candidates[top_k(scores, k, offset=offset)]
+
+    def neighbor_index(self, matrix, k, probes=None):
+        """
+        Approximate (ids, scores) top-k neighbors of every row of the normalized CSR matrix, shaped
+        like neighbors.build_neighbor_index_from_vectors(). Each cluster's rows are scored against
+        the rows of the `probes` clusters whose centroids are closest to its own centroid.
+        """
+        n = matrix.shape[0]
+        k = max(0, min(k, n - 1))
+        probes = probes or self.probes
+        ids = np.empty((n, k), dtype=np.int32)
+        scores = np.empty((n, k), dtype=np.float32)
+        if k == 0:
+            return ids, scores
+
+        for cluster in range(len(self.centroids)):
+            members = self.rows[self.offsets[cluster]:self.offsets[cluster + 1]]
+            if len(members) == 0:
+                continue
+            # A cluster always probes itself, so each member's own column is among the candidates
+            closest = np.union1d(top_k(self.centroids @ self.centroids[cluster], probes), [cluster])
+            candidates = np.sort(np.concatenate([self.rows[self.offsets[c]:self.offsets[c + 1]] for c in closest]))
+            if len(candidates) <= k:
+                candidates = np.arange(n, dtype=self.rows.dtype)
+            # Ascending candidates keep the exact build's tie order (lower row first)
+            block = (matrix[members] @ matrix[candidates].T).toarray()
+            block_ids, block_scores = top_k_rows(block, k, exclude=np.searchsorted(candidates, members))
+            ids[members] = candidates[block_ids]
+            scores[members] = block_scores
+        return ids, scores
+
+
+def load_ann_index(artifacts):
+    """The bundle's ANN index, or None if it was built without one"""
+    if artifacts.has('ann_centroids'):
+        return ClusterIndex.from_artifacts(artifacts)
+    return None
+
+
+def recall_report(vectors, index, queries=500, k=5, probes=None, seed=0):
+    """Mean recall@k of index.search against exact scoring over random query rows, plus timings"""
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(vectors), size=min(queries, len(vectors)), replace=False)
+
+    recall, exact_time, approx_time = 0.0, 0.0, 0.0
+    for row in sample:
+        started = time.perf_counter()
+        exact = top_k(vectors.similarities(row), k, exclude=row)
+        exact_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        approx = index.search(vectors, row, k, probes=probes)
+        approx_time += time.perf_counter() - started
+
+        recall += len(set(exact.tolist()) & set(approx.tolist())) / max(len(exact), 1)
+
+    return {
+        'queries': len(sample),
+        'k': k,
+        'probes': probes or index.probes,
+        'recall': recall / len(sample),
+        'exact_ms': 1000 * exact_time / len(sample),
+        'approx_ms': 1000 * approx_time / len(sample),
+    }
+
+
+def main():
+    from artifacts import DEFAULT_ROOT, derive_bundle, load_artifacts, publish
+    from vectors import SparseVectors
+
+    parser = argparse.ArgumentParser(description="Build or evaluate the ANN index of an artifact bundle")
+    parser.add_argument('--root', default=DEFAULT_ROOT, help="directory holding the bundles")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="write a new bundle version including the ANN index")
+    build.add_argument('--clusters', type=int, default=None, help="default 4*sqrt(N)")
+    build.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    build.add_argument('--seed', type=int, default=0)
+    build.add_argument('--no-publish', action='store_true', help="write the bundle without activating it")
+
+    report = commands.add_parser('report', help="recall@k of approximate against exact search")
+    report.add_argument('--version', default=None)
+    report.add_argument('--queries', type=int, default=500)
+    report.add_argument('--k', type=int, default=5)
+    report.add_argument('--probes', type=int, default=None,
+                        help=f"default max({MIN_PROBES}, {PROBE_FRACTION:.0%} of the clusters)")
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        base = load_artifacts(args.root)
+        started = time.perf_counter()
+        index = ClusterIndex.build(SparseVectors.from_artifacts(base).matrix, clusters=args.clusters,
+                                   iterations=args.iterations, seed=args.seed)
+        clusters = len(index.centroids)
+        version = derive_bundle(args.root, base, arrays=index.bundle_arrays(),
+                                meta={'ann': {'type': 'ivf', 'clusters': clusters, 'seed': args.seed}})
+        if not args.no_publish:
+            publish(args.root, version)
+        print(f"Built ANN index ({clusters} clusters) in {time.perf_counter() - started:.1f}s "
+              f"as version {version}")
+    elif args.command == 'report':
+        artifacts = load_artifacts(args.root, args.version)
+        index = load_ann_index(artifacts)
+        if index is None:
+            parser.error(f"artifact version {artifacts.version} has no ANN index (run `python ann.py build`)")
+        result = recall_report(SparseVectors.from_artifacts(artifacts), index,
+                               queries=args.queries, k=args.k, probes=args.probes)
+        print(f"recall@{result['k']} over {result['queries']} queries with {result['probes']} probes: "
+              f"{result['recall']:.3f} (exact {result['exact_ms']:.2f} ms, "
+              f"approx {result['approx_ms']:.2f} ms per query)")
+
+
+if __name__ == '__main__':
+    main()
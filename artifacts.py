@@ -0,0 +1,308 @@
+"""
+Versioned artifact bundles for the recommender.
+
+The serving process no longer unpickles DataFrames. Everything it needs lives
+in a bundle directory described by a manifest:
+
+    artifacts/
+        CURRENT                    name of the active version (swapped atomically)
+        20261018-120000-3f9a1c2e/
+            manifest.json          format, version, row count, sha256 of every file
+            movie_ids.npy          int64   (N,)    TMDB ids, one per catalog row
+            titles.json            list of N titles, same row order
+            neighbor_ids.npy       int32   (N, K)  see neighbors.py
+            neighbor_scores.npy    float32 (N, K)
+            vectors_*.npy          normalized sparse tag vectors, see vectors.py
+            vocabulary.json        CountVectorizer terms, column order
+            similarity.npy         float32 (N, N)  optional, only with --dense
+
+Files are loaded lazily on first use (.npy files memory-mapped read-only) and
+their checksum is verified at that point, so a request only pays for the
+files it touches. New versions are written to a staging directory, renamed
+into place and then published by rewriting CURRENT, so a half-written bundle
+is never visible to the server.
+
+Usage:
+    python artifacts.py convert --movies movie_list.pkl [--similarity similarity.pkl] [--k 50] [--dense] [--jobs 4]
+    python artifacts.py verify [VERSION]
+    python artifacts.py publish VERSION
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+CURRENT_FILE = 'CURRENT'
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artifacts')
+
+
+class ArtifactError(Exception):
+    """Raised when a bundle is missing, malformed or fails its checksum"""
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hex sha256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Artifacts:
+    """One bundle directory; files are loaded (and verified) on first access"""
+
+    def __init__(self, path, verify=True):
+        self.path = path
+        self.verify = verify
+        try:
+            with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ArtifactError(f"Cannot read manifest in {path}: {e}")
+        if self.manifest.get('format') != FORMAT_VERSION:
+            raise ArtifactError(f"Unsupported artifact format {self.manifest.get('format')!r} in {path}")
+
+        self.version = self.manifest['version']
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.manifest['num_movies']
+
+    def has(self, name):
+        return name in self.manifest['files']
+
+    def get(self, name):
+        """Return a bundle file: .npy files memory-mapped read-only, .json files parsed"""
+        value = self._loaded.get(name)
+        if value is not None:
+            return value
+
+        with self._lock:
+            if name in self._loaded:
+                return self._loaded[name]
+            entry = self.manifest['files'].get(name)
+            if entry is None:
+                raise ArtifactError(f"Artifact version {self.version} has no {name!r}")
+
+            path = os.path.join(self.path, entry['path'])
+            if self.verify and file_sha256(path) != entry['sha256']:
+                raise ArtifactError(f"Checksum mismatch for {path}")
+            if path.endswith('.npy'):
+                value = np.load(path, mmap_mode='r')
+            else:
+                with open(path, encoding='utf-8') as f:
+                    value = json.load(f)
+            self._loaded[name] = value
+            return value
+
+    def verify_all(self):
+        """Check every file in the manifest against its checksum"""
+        for name, entry in self.manifest['files'].items():
+            if file_sha256(os.path.join(self.path, entry['path'])) != entry['sha256']:
+                raise ArtifactError(f"Checksum mismatch for {name} in version {self.version}")
+
+
+def current_version(root=DEFAULT_ROOT):
+    """Name of the published version under root"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise ArtifactError(f"No published artifacts in {root} (run `python artifacts.py convert`)")
+
+
+def load_artifacts(root=DEFAULT_ROOT, version=None, verify=True):
+    """Open a version under root (the published one by default)"""
+    return Artifacts(os.path.join(root, version or current_version(root)), verify=verify)
+
+
+def existing_version(root, digest, files):
+    """A version under root whose manifest lists exactly these files and checksums, or None"""
+    checksums = {name: entry['sha256'] for name, entry in files.items()}
+    for version in sorted(os.listdir(root), reverse=True):
+        if version.startswith('.') or not version.endswith(f"-{digest[:8]}"):
+            continue
+        try:
+            with open(os.path.join(root, version, MANIFEST_FILE), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if {name: entry.get('sha256') for name, entry in manifest.get('files', {}).items()} == checksums:
+            return version
+    return None
+
+
+def write_bundle(root, arrays, tables, meta=None):
+    """
+    Write a new, unpublished version under root and return its name. If a version with the
+    same files already exists, return that one instead, so an unchanged rebuild doesn't make
+    the servers reload. arrays maps names to numpy arrays (.npy), tables maps names to
+    JSON-serializable values.
+    """
+    staging = os.path.join(root, f".staging-{uuid.uuid4().hex[:8]}")
+    os.makedirs(staging)
+    try:
+        files = {}
+        for name, array in arrays.items():
+            filename = f"{name}.npy"
+            np.save(os.path.join(staging, filename), np.ascontiguousarray(array))
+            files[name] = {'path': filename, 'dtype': str(array.dtype), 'shape': list(array.shape)}
+        for name, value in tables.items():
+            filename = f"{name}.json"
+            with open(os.path.join(staging, filename), 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            files[name] = {'path': filename}
+
+        for entry in files.values():
+            path = os.path.join(staging, entry['path'])
+            entry['sha256'] = file_sha256(path)
+            entry['bytes'] = os.path.getsize(path)
+
+        digest = hashlib.sha256("".join(sorted(e['sha256'] for e in files.values())).encode()).hexdigest()
+        version = existing_version(root, digest, files)
+        if version is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+            return version
+        version = f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}-{digest[:8]}"
+        manifest = {
+            'format': FORMAT_VERSION,
+            'version': version,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'num_movies': len(tables['titles']),
+            'files': files,
+            'meta': meta or {},
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        target = os.path.join(root, version)
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Same files written again within the same second: that version already holds them
+            if not os.path.exists(os.path.join(target, MANIFEST_FILE)):
+                raise
+            shutil.rmtree(staging, ignore_errors=True)
+        return version
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def derive_bundle(root, base, arrays=None, tables=None, meta=None, drop=()):
+    """
+    Write a new version containing every file of base except those in drop, with
+    arrays/tables added or replaced and meta merged into base's; returns the new version.
+    """
+    new_arrays, new_tables = {}, {}
+    for name, entry in base.manifest['files'].items():
+        if name in drop:
+            continue
+        target = new_arrays if entry['path'].endswith('.npy') else new_tables
+        target[name] = base.get(name)
+    new_arrays.update(arrays or {})
+    new_tables.update(tables or {})
+    merged_meta = dict(base.manifest.get('meta', {}), parent=base.version, **(meta or {}))
+    return write_bundle(root, new_arrays, new_tables, meta=merged_meta)
+
+
+def publish(root, version):
+    """Atomically make version the one load_artifacts() opens"""
+    Artifacts(os.path.join(root, version), verify=False)  # refuse to publish something unreadable
+    tmp_path = os.path.join(root, f"{CURRENT_FILE}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version + "\n")
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def convert_pickles(movies_path, similarity_path=None, root=DEFAULT_ROOT, k=None, dense=False, jobs=1):
+    """
+    Build a bundle from the notebook's movie_list.pkl and return its version.
+    The tags column is vectorized into sparse vectors; neighbors come from similarity.pkl
+    when given, otherwise they are computed blockwise from the vectors.
+    """
+    from neighbors import DEFAULT_K, build_neighbor_index, build_neighbor_index_from_vectors
+    from vectors import bundle_arrays, vectorize_tags
+
+    with open(movies_path, 'rb') as f:
+        movies = pickle.load(f)
+
+    arrays = {'movie_ids': movies['movie_id'].to_numpy(dtype=np.int64)}
+    tables = {'titles': [str(t) for t in movies['title']]}
+
+    vectors = None
+    if 'tags' in movies:
+        vectors, vocabulary = vectorize_tags(movies['tags'])
+        arrays.update(bundle_arrays(vectors))
+        tables['vocabulary'] = vocabulary
+
+    if similarity_path:
+        with open(similarity_path, 'rb') as f:
+            similarity = pickle.load(f)
+        neighbor_ids, neighbor_scores = build_neighbor_index(similarity, k=k or DEFAULT_K)
+        if dense:
+            arrays['similarity'] = np.asarray(similarity, dtype=np.float32)
+    elif vectors is not None:
+        neighbor_ids, neighbor_scores = build_neighbor_index_from_vectors(vectors, k=k or DEFAULT_K, jobs=jobs)
+    else:
+        raise ArtifactError(f"{movies_path} has no tags column, so --similarity is required")
+    arrays['neighbor_ids'] = neighbor_ids
+    arrays['neighbor_scores'] = neighbor_scores
+
+    os.makedirs(root, exist_ok=True)
+    return write_bundle(root, arrays, tables, meta={'source': 'pickle', 'k': int(neighbor_ids.shape[1])})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, verify and publish recommender artifact bundles")
+    parser.add_argument('--root', default=DEFAULT_ROOT, help="directory holding the bundles")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert = commands.add_parser('convert', help="build a bundle from the notebook pickles and publish it")
+    convert.add_argument('--movies', default='movie_list.pkl')
+    convert.add_argument('--similarity', default=None,
+                         help="notebook similarity.pkl; omit to compute neighbors from the tag vectors")
+    convert.add_argument('--k', type=int, default=None, help="neighbors to keep per movie")
+    convert.add_argument('--dense', action='store_true',
+                         help="also store the full matrix from --similarity as similarity.npy")
+    convert.add_argument('--jobs', type=int, default=1, help="processes scoring neighbors from the tag vectors")
+    convert.add_argument('--no-publish', action='store_true', help="write the bundle without activating it")
+
+    verify = commands.add_parser('verify', help="check every file of a bundle against the manifest")
+    verify.add_argument('version', nargs='?')
+
+    publish_cmd = commands.add_parser('publish', help="make an existing bundle the active one")
+    publish_cmd.add_argument('version')
+
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        started = time.perf_counter()
+        version = convert_pickles(args.movies, args.similarity, args.root, k=args.k, dense=args.dense,
+                                  jobs=args.jobs)
+        if not args.no_publish:
+            publish(args.root, version)
+        print(f"Wrote artifact version {version} in {time.perf_counter() - started:.1f}s"
+              f"{'' if args.no_publish else ' (published)'}")
+    elif args.command == 'verify':
+        artifacts = load_artifacts(args.root, args.version, verify=False)
+        artifacts.verify_all()
+        print(f"Artifact version {artifacts.version}: {len(artifacts.manifest['files'])} files OK")
+    elif args.command == 'publish':
+        publish(args.root, args.version)
+        print(f"Published artifact version {args.version}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""
+Async serving mode: an ASGI entry point for the recommender.
+
+/api/recommend, /api/recommend/stream and /api/movies are served natively
+on the event loop. The title lookup and ranking (CPU-bound NumPy work) run
+in a thread pool, and the TMDB lookups go through one shared aiohttp
+session (see tmdb.py), so a request waiting on TMDB costs a coroutine
+instead of a worker thread and a single process can keep hundreds of them
+in flight. Every other route is the Flask app from main.py, run through
+asgiref's WsgiToAsgi on a pool of WSGI_THREADS threads; those routes wait
+on TMDB like the sync mode does, a thread per request.
+
+Run it with uvicorn directly, or under gunicorn with uvicorn workers (see
+gunicorn.conf.py):
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+    SERVER_MODE=async gunicorn -c gunicorn.conf.py
+
+Requires aiohttp, asgiref and uvicorn.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+import main
+import tmdb
+from single_flight import AsyncSingleFlight
+
+# Threads for title resolution and ranking; NumPy and SciPy release the GIL for most of it
+RANKING_WORKERS = int(os.getenv("RANKING_WORKERS", str(os.cpu_count() or 1)))
+
+# Threads for the routes served by the Flask app; each holds one for its whole request
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "16"))
+
+ranking_executor = ThreadPoolExecutor(max_workers=RANKING_WORKERS, thread_name_prefix="ranking")
+wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+# Concurrent misses for the same ranking share one enrichment, like main.recommend_flight
+recommend_flight = AsyncSingleFlight()
+
+
+class ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    """
+    WsgiToAsgi runs the WSGI app with a thread-sensitive sync_to_async, i.e. every request
+    of the process on one shared thread; run each on a thread of wsgi_executor instead.
+    """
+
+    async def run_wsgi_app(self, body):
+        run = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+        await sync_to_async(run, thread_sensitive=False, executor=wsgi_executor)(self, body)
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+flask_app = ThreadPoolWsgiToAsgi(main.app)
+
+
+def resolve_request(catalog, movie, k, offset, mode):
+    """
+    Resolve the title (fuzzy matching can take a while) and check the response cache;
+    runs in the ranking executor. Returns (match, cache key, cached result or None).
+    """
+    match = catalog.title_index.resolve(movie)
+    if match is None:
+        return None, None, None
+
+    key = (match.row, k, offset, mode or main.RECOMMEND_MODE)
+    return match, key, main.response_cache.get(catalog.version, key)
+
+
+async def recommend(catalog, movie, k, offset, mode):
+    """main.recommend() with title matching and ranking off the event loop and TMDB lookups on it"""
+    loop = asyncio.get_running_loop()
+    match, key, cached = await loop.run_in_executor(ranking_executor, resolve_request, catalog, movie, k, offset, mode)
+    if match is None:
+        return None, [], [], []
+    if cached is not None:
+        return (match,) + cached
+    return (match,) + await recommend_flight.do((catalog.version,) + key, recommend_and_cache, catalog, key)
+
+
+async def recommend_and_cache(catalog, key):
+    """main.recommend_and_cache() with the enrichment awaited on the event loop"""
+    row, k, offset, mode = key
+    try:
+        loop = asyncio.get_running_loop()
+        top_indices = await loop.run_in_executor(
+            ranking_executor, main.rank_neighbors, catalog, row, k, offset, mode)
+        catalog_ids = catalog.artifacts.get('movie_ids')
+        names = [catalog.title_index.titles[i] for i in top_indices]
+        metadata = await tmdb.fetch_many_async([int(catalog_ids[i]) for i in top_indices])
+        posters = [poster for poster, _ in metadata]
+        ratings = [rating for _, rating in metadata]
+    except Exception as e:
+        print(f"Error in recommend function: {e}")
+        return [], [], []
+
+    # Don't pin placeholders from a TMDB error or an exhausted time budget
+    if names and main.POSTER_ERROR not in posters:
+        main.response_cache.put(catalog.version, key, (names, posters, ratings))
+    return names, posters, ratings
+
+
+async def read_body(receive, limit):
+    """The request body, or None if it is longer than limit"""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def send_json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+                   + list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def read_json(receive):
+    """
+    The request body as a JSON object, or {} if it isn't one (like Flask's get_json(silent=True) or {});
+    None if it is longer than MAX_CONTENT_LENGTH
+    """
+    body = await read_body(receive, main.app.config['MAX_CONTENT_LENGTH'])
+    if body is None:
+        return None
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def movies_endpoint(scope, receive, send):
+    """/api/movies (autocomplete) with the same response as the Flask route"""
+    query = parse_qs(scope['query_string'].decode('latin-1')).get('q', [''])[0].lower()
+    catalog = main.acquire_catalog()
+    if catalog is None:
+        return await send_json(send, 500, {'error': 'Movie data not loaded'})
+    try:
+        titles = catalog.title_index.titles
+        if query:
+            loop = asyncio.get_running_loop()
+            rows = await loop.run_in_executor(ranking_executor, catalog.title_index.search, query, 20)
+            movies = [titles[i] for i in rows]
+        else:
+            movies = titles[:50]
+        await send_json(send, 200, movies, [(b'x-artifact-version', catalog.version.encode())])
+    finally:
+        catalog.release()
+
+
+async def stream_lines(catalog, movie_name, match, key, cached):
+    """The NDJSON lines of main.stream_recommendations(), with the TMDB lookups awaited on the event loop"""
+    ranking = {
+        'type': 'ranking',
+        'selected_movie': movie_name,
+        'matched_movie': match.title if match else None,
+        'match_type': match.match_type if match else None,
+    }
+    if match is None:
+        yield dict(ranking, recommendations=[])
+    elif cached is not None:
+        # Already enriched: everything goes out in the first line
+        names, posters, ratings = cached
+        ranking['recommendations'] = [
+            {'rank': i, 'title': name, 'poster': poster, 'rating': rating}
+            for i, (name, poster, rating) in enumerate(zip(names, posters, ratings))
+        ]
+        yield ranking
+    else:
+        row, k, offset, mode = key
+        loop = asyncio.get_running_loop()
+        top_indices = await loop.run_in_executor(
+            ranking_executor, main.rank_neighbors, catalog, row, k, offset, mode)
+        names = [catalog.title_index.titles[i] for i in top_indices]
+        ranking['recommendations'] = [{'rank': i, 'title': name} for i, name in enumerate(names)]
+        yield ranking
+
+        catalog_ids = catalog.artifacts.get('movie_ids')
+        posters, ratings = [None] * len(names), [None] * len(names)
+        async for i, (poster, rating) in tmdb.fetch_as_completed_async([int(catalog_ids[r]) for r in top_indices]):
+            posters[i], ratings[i] = poster, rating
+            yield {'type': 'metadata', 'rank': i, 'poster': poster, 'rating': rating}
+
+        if names and main.POSTER_ERROR not in posters:
+            main.response_cache.put(catalog.version, key, (names, posters, ratings))
+    yield {'type': 'done'}
+
+
+async def stream_endpoint(scope, receive, send):
+    """/api/recommend/stream with the same request and NDJSON response format as the Flask route"""
+    if scope['method'] != 'POST':
+        return await send_json(send, 405, {'error': 'Method not allowed'}, [(b'allow', b'POST')])
+    data = await read_json(receive)
+    if data is None:
+        return await send_json(send, 413, {'error': 'File too large. Maximum size is 16MB.'})
+
+    catalog = main.acquire_catalog()
+    if catalog is None:
+        return await send_json(send, 500, {'error': 'Movie data not loaded'})
+    try:
+        movie_name = data.get('movie', '')
+        if not movie_name:
+            return await send_json(send, 400, {'error': 'Movie name is required'})
+        try:
+            k, offset, mode = main.parse_ranking_options(data)
+        except ValueError as e:
+            return await send_json(send, 400, {'error': str(e)})
+
+        loop = asyncio.get_running_loop()
+        match, key, cached = await loop.run_in_executor(
+            ranking_executor, resolve_request, catalog, movie_name, k, offset, mode)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'application/x-ndjson'), (b'cache-control', b'no-store'),
+                        # Ask reverse proxies not to buffer the stream
+                        (b'x-accel-buffering', b'no'), (b'x-artifact-version', catalog.version.encode())],
+        })
+        async for line in stream_lines(catalog, movie_name, match, key, cached):
+            await send({'type': 'http.response.body', 'body': json.dumps(line).encode('utf-8') + b'\n',
+                        'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        catalog.release()
+
+
+async def recommend_endpoint(scope, receive, send):
+    """/api/recommend with the same request and response format as the Flask route"""
+    request_headers = dict(scope['headers'])
+    if scope['method'] == 'GET':
+        data = {name: values[0] for name, values in parse_qs(scope['query_string'].decode('latin-1')).items()}
+    elif scope['method'] == 'POST':
+        body = await read_body(receive, main.app.config['MAX_CONTENT_LENGTH'])
+        if body is None:
+            return await send_json(send, 413, {'error': 'File too large. Maximum size is 16MB.'})
+        try:
+            data = json.loads(body or b'{}')
+        except ValueError:
+            return await send_json(send, 400, {'error': 'Request body must be JSON'})
+        if not isinstance(data, dict):
+            return await send_json(send, 400, {'error': 'Request body must be a JSON object'})
+    else:
+        return await send_json(send, 405, {'error': 'Method not allowed'}, [(b'allow', b'GET, POST')])
+
+    catalog = main.acquire_catalog()
+    if catalog is None:
+        return await send_json(send, 500, {'error': 'Movie data not loaded'})
+    try:
+        movie_name = data.get('movie', '')
+        if not movie_name:
+            return await send_json(send, 400, {'error': 'Movie name is required'})
+        try:
+            k, offset, mode = main.parse_ranking_options(data)
+        except ValueError as e:
+            return await send_json(send, 400, {'error': str(e)})
+
+        match, names, posters, ratings = await recommend(catalog, movie_name, k, offset, mode)
+        payload = main.recommendation_body(movie_name, match, names, posters, ratings)
+        headers = [(b'x-artifact-version', catalog.version.encode())]
+    finally:
+        catalog.release()
+
+    if not names or main.POSTER_ERROR in posters:
+        return await send_json(send, 200, payload, headers + [(b'cache-control', b'no-store')])
+
+    etag = '"%s"' % hashlib.sha1(json.dumps(payload).encode('utf-8')).hexdigest()
+    headers += [(b'etag', etag.encode()), (b'cache-control', b'public, max-age=%d' % main.RESPONSE_CACHE_MAX_AGE)]
+    # Answers If-None-Match on GET with 304 Not Modified
+    if scope['method'] == 'GET' and etag in request_headers.get(b'if-none-match', b'').decode('latin-1'):
+        await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+        return await send({'type': 'http.response.body', 'body': b''})
+    await send_json(send, 200, payload, headers)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # gunicorn.conf.py may already have loaded the catalog in post_worker_init
+            if main.catalog is None:
+                main.load_data()
+                main.start_reload_triggers()
+            tmdb.open_async_client()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await tmdb.close_async_client()
+            ranking_executor.shutdown(wait=False)
+            wsgi_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+native_routes = {
+    '/api/recommend': recommend_endpoint,
+    '/api/recommend/stream': stream_endpoint,
+    '/api/movies': movies_endpoint,
+}
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http' and scope['path'] in native_routes:
+        return await native_routes[scope['path']](scope, receive, send)
+    return await flask_app(scope, receive, send)
@@ -0,0 +1,346 @@
+"""
+Benchmarks for the serving hot paths on a synthetic catalog.
+
+Builds (or reuses) an artifact bundle of --movies made-up movies, starts
+fake_tmdb.py as a separate process (optionally with errors and 429s),
+points the app at both and measures:
+
+    title_resolve     TitleIndex.resolve() on exact, lowercased and misspelled titles
+    search            GET /api/movies?q=<prefix> (autocomplete)
+    rank_neighbors    ranking from the precomputed neighbors (the default page)
+    rank_exact        ranking past the precomputed neighbors, scoring every movie
+    rank_approx       the same through the ANN index (with --ann)
+    tmdb_cold         fetch_poster_and_rating() on cache misses, through the fake TMDB
+    tmdb_warm         fetch_poster_and_rating() on cache hits
+    recommend         GET /api/recommend end to end, one request at a time
+    recommend_concurrent  the same from --concurrency threads
+
+Each reports p50/p99/mean latency in ms, throughput and the process's peak
+RSS so far. Results are printed and, with --output, written as JSON; pass a
+previous run's file as --compare to see the change per benchmark, e.g.
+between two commits:
+
+    python bench.py --movies 20000 --output before.json
+    git checkout feature && python bench.py --movies 20000 --compare before.json
+
+Synthetic catalogs are cached under --root by size and seed. Building the
+exact neighbors is quadratic in the catalog size: minutes for 200k movies
+(the production build can approximate them instead, see build.py --ann-neighbors).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ROOT = os.path.join(HERE, 'build_cache', 'bench')
+
+SYLLABLES = ['ka', 'ro', 'mi', 'sen', 'tal', 'vo', 'dre', 'lu', 'nax', 'pi', 'gor', 'el', 'thu', 'ban', 'is',
+             'qua', 'mor', 'fen', 'zi', 'ock', 'ar', 'dun', 'ley', 'shi', 'vex', 'o', 'ran', 'tes']
+
+
+def make_words(rng, count, min_syllables=2, max_syllables=4):
+    """count distinct pronounceable made-up words"""
+    words = set()
+    while len(words) < count:
+        n = rng.integers(min_syllables, max_syllables + 1)
+        words.add(''.join(rng.choice(SYLLABLES, n)))
+    return sorted(words)
+
+
+def synthetic_movies(n, seed=0, tags_per_movie=40, vocabulary_size=4000):
+    """
+    n (title, tags) pairs. Tags are drawn from a Zipf-like distribution so some terms are shared
+    by many movies, like genres and popular cast; titles are unique, sequels get a number.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(make_words(rng, vocabulary_size))
+    weights = 1.0 / np.arange(1, vocabulary_size + 1)
+    weights /= weights.sum()
+    title_words = make_words(rng, 3000, 1, 3)
+
+    titles, seen = [], {}
+    for _ in range(n):
+        title = ' '.join(rng.choice(title_words, rng.integers(1, 4))).title()
+        seen[title] = seen.get(title, 0) + 1
+        titles.append(title if seen[title] == 1 else f"{title} {seen[title]}")
+    tags = [' '.join(vocabulary[rng.choice(vocabulary_size, tags_per_movie, p=weights)]) for _ in range(n)]
+    return titles, tags
+
+
+def build_catalog(root, n, seed=0, ann=False, jobs=1):
+    """Write and publish a synthetic bundle under root; returns its version"""
+    from ann import ClusterIndex
+    from artifacts import publish, write_bundle
+    from neighbors import DEFAULT_K, build_neighbor_index_from_vectors
+    from vectors import bundle_arrays, vectorize_tags
+
+    titles, tags = synthetic_movies(n, seed)
+    vectors, vocabulary = vectorize_tags(tags)
+    with tempfile.TemporaryDirectory(dir=root) as scratch:
+        neighbor_ids, neighbor_scores = build_neighbor_index_from_vectors(
+            vectors, k=DEFAULT_K, jobs=jobs, out_dir=scratch)
+        arrays = dict(bundle_arrays(vectors), movie_ids=np.arange(1, n + 1, dtype=np.int64),
+                      neighbor_ids=neighbor_ids, neighbor_scores=neighbor_scores)
+        meta = {'source': 'synthetic', 'seed': seed, 'k': int(neighbor_ids.shape[1])}
+        if ann:
+            index = ClusterIndex.build(vectors)
+            arrays.update(index.bundle_arrays())
+            meta['ann'] = {'type': 'ivf', 'clusters': len(index.centroids), 'seed': 0}
+        version = write_bundle(root, arrays, {'titles': titles, 'vocabulary': vocabulary}, meta=meta)
+    publish(root, version)
+    return version
+
+
+def catalog_root(base, n, seed, ann, jobs):
+    """Directory of the synthetic bundle for (n, seed, ann), building it first if needed"""
+    root = os.path.join(base, f"synthetic-{n}-{seed}{'-ann' if ann else ''}")
+    if not os.path.exists(os.path.join(root, 'CURRENT')):
+        os.makedirs(root, exist_ok=True)
+        print(f"Building a synthetic catalog of {n} movies in {root} ...", flush=True)
+        started = time.perf_counter()
+        # In a child process, so building doesn't count towards the peak RSS being measured
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            pool.submit(build_catalog, root, n, seed, ann, jobs).result()
+        print(f"Built in {time.perf_counter() - started:.1f}s", flush=True)
+    return root
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_fake_tmdb(options=()):
+    """
+    Run fake_tmdb.py with extra command-line options in its own process (so it doesn't
+    compete for our GIL); returns (process, base URL)
+    """
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, 'fake_tmdb.py'), '--port', str(port), *options],
+                               stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, f"http://127.0.0.1:{port}/3"
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("fake_tmdb.py did not start")
+            time.sleep(0.05)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20 if sys.platform == 'darwin' else 1 << 10), 1)
+
+
+def summarize(latencies, elapsed):
+    """Latency percentiles (ms), throughput and peak RSS for one benchmark"""
+    ms = np.asarray(latencies) * 1000
+    return {
+        'count': len(ms),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'mean_ms': round(float(ms.mean()), 4),
+        'throughput_per_s': round(len(ms) / elapsed, 1) if elapsed > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run(fn, inputs):
+    """Call fn on each input in turn and summarize"""
+    latencies = []
+    started = time.perf_counter()
+    for item in inputs:
+        t = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def run_concurrent(fn, inputs, concurrency):
+    """Call fn on every input from concurrency threads and summarize; throughput is over the wall time"""
+    def timed(item):
+        t = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - t
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, inputs))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def misspell(rng, title):
+    """title with one character dropped and one swapped, for the fuzzy matching path"""
+    chars = list(title.lower())
+    if len(chars) > 3:
+        del chars[rng.randrange(len(chars))]
+        i = rng.randrange(len(chars) - 1)
+        chars[i], chars[i + 1] = chars[i + 1], chars[i]
+    return ''.join(chars)
+
+
+def benchmark(args):
+    """Run every benchmark; returns {name: summary}"""
+    # The app reads these at import time
+    root = catalog_root(args.root, args.movies, args.seed, args.ann, args.jobs)
+    os.environ['ARTIFACT_DIR'] = root
+    os.environ.setdefault('TMDB_API_KEY', 'bench')
+    # The bench measures our code, not TMDB's quota; override with TMDB_RATE_LIMIT if wanted
+    os.environ.setdefault('TMDB_RATE_LIMIT', '1000000')
+    os.environ.setdefault('TMDB_RATE_BURST', '1000000')
+    cache_dir = tempfile.mkdtemp(prefix='bench-tmdb-')
+    os.environ['TMDB_CACHE_PATH'] = os.path.join(cache_dir, 'tmdb_cache.sqlite3')
+    fake, os.environ['TMDB_API_URL'] = start_fake_tmdb([
+        '--latency', args.tmdb_latency, '--error-rate', str(args.tmdb_error_rate),
+        '--throttle-rate', str(args.tmdb_throttle_rate), '--seed', str(args.seed)])
+
+    try:
+        import main
+        import tmdb
+        from metadata_cache import MetadataCache
+
+        main.load_data()
+        catalog = main.catalog
+        if catalog is None:
+            raise RuntimeError(f"Could not load the synthetic catalog from {root}")
+        rng = random.Random(args.seed)
+        titles = catalog.title_index.titles
+        n = len(titles)
+        rows = [rng.randrange(n) for _ in range(args.iterations)]
+        client = main.app.test_client()
+        results = {}
+
+        def record(name, summary):
+            results[name] = summary
+            print(f"  {name:<22} p50 {summary['p50_ms']:9.3f} ms  p99 {summary['p99_ms']:9.3f} ms  "
+                  f"{summary['throughput_per_s'] or 0:10.1f}/s  rss {summary['peak_rss_mb']:8.1f} MB", flush=True)
+
+        queries = [[titles[row], titles[row].lower(), misspell(rng, titles[row])][i % 3] for i, row in enumerate(rows)]
+        record('title_resolve', run(catalog.title_index.resolve, queries))
+        prefixes = [titles[row][:rng.randint(2, 6)].lower() for row in rows]
+        record('search', run(lambda q: client.get('/api/movies', query_string={'q': q}), prefixes))
+
+        k = main.DEFAULT_RECOMMENDATIONS
+        depth = catalog.artifacts.get('neighbor_ids').shape[1]
+        record('rank_neighbors', run(lambda row: main.rank_neighbors(catalog, row, k), rows))
+        record('rank_exact', run(lambda row: main.rank_neighbors(catalog, row, k, depth, 'exact'), rows))
+        if catalog.ann_index is not None:
+            record('rank_approx', run(lambda row: main.rank_neighbors(catalog, row, k, depth, 'approx'), rows))
+
+        movie_ids = catalog.artifacts.get('movie_ids')
+        lookup_ids = [int(movie_ids[row]) for row in dict.fromkeys(rows)]
+        record('tmdb_cold', run(tmdb.fetch_poster_and_rating, lookup_ids))
+        record('tmdb_warm', run(tmdb.fetch_poster_and_rating, lookup_ids))
+
+        def recommend(row):
+            response = client.get('/api/recommend', query_string={'movie': titles[row]})
+            if response.status_code != 200:
+                raise RuntimeError(f"/api/recommend returned {response.status_code}")
+
+        # Empty caches, so every request ranks and enriches
+        main.response_cache.clear()
+        tmdb.cache = MetadataCache(os.path.join(cache_dir, 'recommend.sqlite3'), ttl=tmdb.TMDB_CACHE_TTL)
+        record('recommend', run(recommend, [rng.randrange(n) for _ in range(args.iterations)]))
+        main.response_cache.clear()
+        tmdb.cache = MetadataCache(os.path.join(cache_dir, 'concurrent.sqlite3'), ttl=tmdb.TMDB_CACHE_TTL)
+        record('recommend_concurrent', run_concurrent(
+            recommend, [rng.randrange(n) for _ in range(args.iterations)], args.concurrency))
+        return results
+    finally:
+        fake.terminate()
+        fake.wait()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, params, baseline):
+    """Print each benchmark's change against a previous run's JSON"""
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'}:")
+    if baseline['meta'].get('params') != params:
+        print(f"  (run with different parameters: {baseline['meta'].get('params')})")
+    for name, summary in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        changes = []
+        for field in ('p50_ms', 'p99_ms', 'throughput_per_s'):
+            if before.get(field) and summary.get(field) is not None:
+                changes.append(f"{field} {100 * (summary[field] / before[field] - 1):+7.1f}%")
+        print(f"  {name:<22} " + "  ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search, ranking and enrichment on a synthetic catalog")
+    parser.add_argument('--movies', type=int, default=5000, help="synthetic catalog size (1k-200k)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=1000, help="calls per benchmark")
+    parser.add_argument('--concurrency', type=int, default=16, help="threads for recommend_concurrent")
+    parser.add_argument('--tmdb-latency', default='0.02',
+                        help="fake TMDB delay per call, e.g. 0.02 or lognormal:0.02,0.5 (see fake_tmdb.py)")
+    parser.add_argument('--tmdb-error-rate', type=float, default=0.0, help="fraction of fake TMDB 500/503s")
+    parser.add_argument('--tmdb-throttle-rate', type=float, default=0.0, help="fraction of fake TMDB 429s")
+    parser.add_argument('--ann', action='store_true', help="build the ANN index and benchmark approx ranking")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="processes for the catalog build")
+    parser.add_argument('--root', default=DEFAULT_ROOT, help="where synthetic catalogs are cached")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="a previous --output file to compare against")
+    args = parser.parse_args()
+
+    print(f"Benchmarking {args.movies} movies, {args.iterations} iterations each")
+    results = benchmark(args)
+    import tmdb
+
+    client_status = tmdb.status()
+    if client_status['breaker_opened']:
+        print(f"Note: the TMDB circuit breaker opened {client_status['breaker_opened']} times; "
+              f"lookups while it was open returned fallbacks without calling the fake TMDB")
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'params': {name: getattr(args, name) for name in (
+                'movies', 'seed', 'iterations', 'concurrency', 'tmdb_latency', 'tmdb_error_rate',
+                'tmdb_throttle_rate', 'ann')},
+            'tmdb_client': client_status,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, report['meta']['params'], json.load(f))
+
+
+if __name__ == '__main__':
+    main()
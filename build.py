@@ -0,0 +1,226 @@
+"""
+Reproducible build of the serving artifacts from the raw TMDB 5000 CSVs.
+
+Replaces the preprocessing cells of Untitled.ipynb with a staged pipeline:
+
+    load        read and join tmdb_5000_movies.csv and tmdb_5000_credits.csv
+    parse       json.loads the genres/keywords/cast/crew columns and build each
+                movie's tags, in chunks across worker processes
+    vectorize   CountVectorizer over the tags into normalized sparse vectors
+    ann         optional IVF index (see ann.py)
+    neighbors   top-K neighbors per movie from the vectors, row blocks scored
+                across worker processes and streamed to disk (see neighbors.py);
+                with --ann-neighbors, approximated through the IVF index instead,
+                which scales to catalogs where the exact O(N^2) build takes too long
+
+Every stage's output is cached under --cache-dir, keyed by a hash of its
+parameters and its inputs' keys (the CSVs' checksums for the first stage),
+so rerunning with unchanged inputs skips straight to writing the bundle.
+The bundle is written and published with artifacts.py; timings per stage are
+printed and stored in the manifest meta.
+
+Two notebook bugs are fixed (here and in the notebook): collapse() iterated its empty output
+list, so genres, keywords, cast and crew never reached the tags, and
+fetch_director() returned after the first crew member and compared against
+'director' instead of 'Director'. The CSVs are joined on the TMDB id rather
+than on title, which duplicated movies sharing a title.
+
+Usage:
+    python build.py --movies-csv tmdb_5000_movies.csv --credits-csv tmdb_5000_credits.csv [--jobs 4] [--ann]
+                    [--ann-neighbors]
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from artifacts import DEFAULT_ROOT, file_sha256, publish, write_bundle
+from neighbors import DEFAULT_K, build_neighbor_index_from_vectors
+from vectors import MAX_FEATURES, bundle_arrays, vectorize_tags
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build_cache')
+DEFAULT_CHUNK_SIZE = 500
+# Bump a stage's number when its code changes so stale cached outputs are not reused
+STAGE_VERSIONS = {'load': 1, 'parse': 1, 'vectorize': 1, 'neighbors': 1, 'ann': 1}
+CAST_MEMBERS = 3
+
+
+def names(text, limit=None):
+    """The 'name' of every object in a TMDB JSON list column"""
+    return [item['name'] for item in json.loads(text)[:limit]]
+
+
+def directors(text):
+    """Every crew member whose job is Director"""
+    return [member['name'] for member in json.loads(text) if member.get('job') == 'Director']
+
+
+def collapse(values):
+    """Drop spaces so multi-word names become single tokens ('Sam Worthington' -> 'SamWorthington')"""
+    return [value.replace(" ", "") for value in values]
+
+
+def movie_tags(record):
+    """The notebook's tags string: overview words, then genres, keywords, top cast and directors"""
+    return " ".join(
+        record['overview'].split()
+        + collapse(names(record['genres']))
+        + collapse(names(record['keywords']))
+        + collapse(names(record['cast'], limit=CAST_MEMBERS))
+        + collapse(directors(record['crew']))
+    )
+
+
+def parse_chunk(records):
+    """(movie_id, title, tags) for a chunk of joined CSV rows; runs in a worker process"""
+    return [(int(r['movie_id']), str(r['title']), movie_tags(r)) for r in records]
+
+
+def load_csvs(movies_csv, credits_csv):
+    """Joined rows with the columns the tags are built from; rows missing any of them are dropped"""
+    import pandas as pd
+
+    movies = pd.read_csv(movies_csv, usecols=['id', 'title', 'overview', 'genres', 'keywords'])
+    credits = pd.read_csv(credits_csv, usecols=['movie_id', 'cast', 'crew'])
+    joined = movies.rename(columns={'id': 'movie_id'}).merge(credits, on='movie_id')
+    joined = joined[['movie_id', 'title', 'overview', 'genres', 'keywords', 'cast', 'crew']].dropna()
+    return joined.to_dict('records')
+
+
+def compute_neighbors(vectors, k, jobs, scratch_root):
+    """Blocked, multi-process neighbor build whose result is written to a scratch dir, not held in RAM"""
+    scratch = tempfile.mkdtemp(prefix='neighbors-', dir=scratch_root)
+    try:
+        # The returned memory maps stay readable after their files are unlinked
+        return build_neighbor_index_from_vectors(vectors, k=k, jobs=jobs, out_dir=scratch)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def parse_records(records, jobs, chunk_size=DEFAULT_CHUNK_SIZE):
+    """parse_chunk() over chunks of records in a process pool; row order is preserved"""
+    chunks = [records[i:i + chunk_size] for i in range(0, len(records), chunk_size)]
+    if jobs <= 1:
+        return [movie for chunk in chunks for movie in parse_chunk(chunk)]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return [movie for chunk in pool.map(parse_chunk, chunks) for movie in chunk]
+
+
+class Pipeline:
+    """Runs stages in order, reusing cached outputs whose key is unchanged, and times each one"""
+
+    def __init__(self, cache_dir, force=False):
+        self.cache_dir = cache_dir
+        self.force = force
+        self.timings = []
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def run(self, name, params, compute):
+        """
+        Output of stage name for params (which include upstream keys); returns (output, key).
+        compute() is only called when there is no cached output for the key.
+        """
+        fingerprint = json.dumps([name, STAGE_VERSIONS[name], params], sort_keys=True)
+        key = hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+        path = os.path.join(self.cache_dir, f"{name}-{key}.pkl")
+        started = time.perf_counter()
+        if not self.force and os.path.exists(path):
+            with open(path, 'rb') as f:
+                output = pickle.load(f)
+            status = 'cached'
+        else:
+            output = compute()
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            status = 'built'
+        elapsed = time.perf_counter() - started
+        self.timings.append({'stage': name, 'status': status, 'seconds': round(elapsed, 3)})
+        print(f"  {name:<10} {status:<7} {elapsed:8.2f}s")
+        return output, key
+
+
+def build(movies_csv, credits_csv, root=DEFAULT_ROOT, cache_dir=DEFAULT_CACHE_DIR, jobs=None,
+          chunk_size=DEFAULT_CHUNK_SIZE, k=DEFAULT_K, max_features=MAX_FEATURES, ann=False, ann_neighbors=False,
+          force=False):
+    """
+    Run the pipeline and write an (unpublished) bundle; returns (version, stage timings).
+    ann_neighbors computes the neighbor lists from the IVF index (and implies ann).
+    """
+    jobs = jobs or os.cpu_count() or 1
+    pipeline = Pipeline(cache_dir, force=force)
+
+    inputs = {'movies': file_sha256(movies_csv), 'credits': file_sha256(credits_csv)}
+    records, key = pipeline.run('load', inputs, lambda: load_csvs(movies_csv, credits_csv))
+    movies, key = pipeline.run('parse', {'input': key}, lambda: parse_records(records, jobs, chunk_size))
+    (vectors, vocabulary), key = pipeline.run(
+        'vectorize', {'input': key, 'max_features': max_features},
+        lambda: vectorize_tags([tags for _, _, tags in movies], max_features=max_features))
+
+    arrays = dict(bundle_arrays(vectors), movie_ids=np.array([m[0] for m in movies], dtype=np.int64))
+    meta = {'source': 'csv'}
+    if ann or ann_neighbors:
+        from ann import ClusterIndex
+
+        index, ann_key = pipeline.run('ann', {'input': key}, lambda: ClusterIndex.build(vectors))
+        arrays.update(index.bundle_arrays())
+        meta['ann'] = {'type': 'ivf', 'clusters': len(index.centroids), 'seed': 0}
+
+    if ann_neighbors:
+        (neighbor_ids, neighbor_scores), _ = pipeline.run(
+            'neighbors', {'input': key, 'k': k, 'ann': ann_key}, lambda: index.neighbor_index(vectors, k))
+    else:
+        (neighbor_ids, neighbor_scores), _ = pipeline.run(
+            'neighbors', {'input': key, 'k': k}, lambda: compute_neighbors(vectors, k, jobs, cache_dir))
+    arrays.update(neighbor_ids=neighbor_ids, neighbor_scores=neighbor_scores)
+    meta.update(k=int(neighbor_ids.shape[1]), neighbors='ann' if ann_neighbors else 'exact')
+
+    started = time.perf_counter()
+    tables = {'titles': [title for _, title, _ in movies], 'vocabulary': vocabulary}
+    meta['build'] = {'stages': pipeline.timings, 'inputs': inputs}
+    os.makedirs(root, exist_ok=True)
+    version = write_bundle(root, arrays, tables, meta=meta)
+    elapsed = time.perf_counter() - started
+    pipeline.timings.append({'stage': 'bundle', 'status': 'built', 'seconds': round(elapsed, 3)})
+    print(f"  {'bundle':<10} {'built':<7} {elapsed:8.2f}s")
+    return version, pipeline.timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the serving artifacts from the TMDB 5000 CSVs")
+    parser.add_argument('--movies-csv', default='tmdb_5000_movies.csv')
+    parser.add_argument('--credits-csv', default='tmdb_5000_credits.csv')
+    parser.add_argument('--root', default=DEFAULT_ROOT, help="directory holding the bundles")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="where stage outputs are cached")
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows per parse task")
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help="neighbors to keep per movie")
+    parser.add_argument('--max-features', type=int, default=MAX_FEATURES)
+    parser.add_argument('--ann', action='store_true', help="also build the approximate nearest-neighbor index")
+    parser.add_argument('--ann-neighbors', action='store_true',
+                        help="approximate the neighbor lists with the ANN index (for large catalogs; implies --ann)")
+    parser.add_argument('--force', action='store_true', help="ignore cached stage outputs")
+    parser.add_argument('--no-publish', action='store_true', help="write the bundle without activating it")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    print("Stage      Status      Time")
+    version, _ = build(args.movies_csv, args.credits_csv, args.root, args.cache_dir, jobs=args.jobs,
+                       chunk_size=args.chunk_size, k=args.k, max_features=args.max_features,
+                       ann=args.ann, ann_neighbors=args.ann_neighbors, force=args.force)
+    if not args.no_publish:
+        publish(args.root, version)
+    print(f"Wrote artifact version {version} in {time.perf_counter() - started:.1f}s"
+          f"{'' if args.no_publish else ' (published)'}")
+
+
+if __name__ == '__main__':
+    main()
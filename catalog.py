@@ -0,0 +1,61 @@
+"""
+Everything the server reads from one artifact version, swappable as a unit.
+
+A Catalog is fully built (titles indexed, hot files mapped and verified)
+before it is handed to requests, so a reload never exposes a half-loaded
+version. Each request pins the Catalog that was current when it started and
+releases it when it ends; once a replaced Catalog has no requests left it is
+retired and its memory maps are dropped with it.
+"""
+import threading
+import time
+
+from ann import load_ann_index
+from artifacts import load_artifacts
+from title_index import TitleIndex
+from vectors import SparseVectors
+
+# Files every request path may touch; loading them up front verifies their checksums off the hot path
+HOT_FILES = ('movie_ids', 'neighbor_ids', 'neighbor_scores')
+
+
+class Catalog:
+    """One loaded artifact version plus a count of the requests still using it"""
+
+    def __init__(self, artifacts):
+        self.artifacts = artifacts
+        self.version = artifacts.version
+        self.title_index = TitleIndex(artifacts.get('titles'))
+        self.vectors = SparseVectors.from_artifacts(artifacts) if artifacts.has('vectors_data') else None
+        self.ann_index = load_ann_index(artifacts)
+        for name in HOT_FILES:
+            if artifacts.has(name):
+                artifacts.get(name)
+        self.row_by_movie_id = {int(movie_id): row for row, movie_id in enumerate(artifacts.get('movie_ids'))}
+        self.loaded_at = time.time()
+
+        self.in_flight = 0
+        self._idle = threading.Condition()
+
+    @classmethod
+    def load(cls, root, version=None, verify=True):
+        return cls(load_artifacts(root, version, verify=verify))
+
+    def __len__(self):
+        return len(self.artifacts)
+
+    def acquire(self):
+        with self._idle:
+            self.in_flight += 1
+        return self
+
+    def release(self):
+        with self._idle:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """Block until no request holds this catalog; False if timeout passed first"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self.in_flight == 0, timeout)
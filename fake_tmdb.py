@@ -0,0 +1,221 @@
+"""
+Stand-in for the TMDB API, for load tests, benchmarks, CI and offline development.
+
+Serves GET /3/movie/{id} without the network or a real API key, so the
+enrichment path can be exercised deterministically:
+
+    records      from a fixture file (--fixture), else made up for any id
+    latency      a per-response delay drawn from a distribution (--latency)
+    errors       a fraction of 500/503 responses (--error-rate)
+    rate limits  429 with Retry-After, for a random fraction of requests
+                 (--throttle-rate) and/or above a request rate (--quota)
+
+GET /stats returns how many responses of each status were sent. Point the
+app at it with TMDB_API_URL (see tmdb.py):
+
+    python fake_tmdb.py --port 5088 --fixture tmdb_fixture.json --latency lognormal:0.08,0.5 --error-rate 0.01
+    TMDB_API_URL=http://127.0.0.1:5088/3 TMDB_API_KEY=fake python main.py
+
+A fixture is a JSON list of TMDB movie records (each with its "id") or an
+object mapping ids to records. Ids missing from it get TMDB's 404. Write one
+for every movie in an artifact bundle with --write-fixture:
+
+    python fake_tmdb.py --write-fixture tmdb_fixture.json [--artifact-dir artifacts]
+
+Latency specs: SECONDS, fixed:SECONDS, uniform:LOW,HIGH, normal:MEAN,SD,
+lognormal:MEDIAN,SIGMA or exponential:MEAN.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from resilience import TokenBucket
+
+MOVIE_PATH = re.compile(r'^/3/movie/(\d+)$')
+
+# TMDB's error bodies
+NOT_FOUND = {'success': False, 'status_code': 34, 'status_message': "The resource you requested could not be found."}
+INVALID_KEY = {'success': False, 'status_code': 7,
+               'status_message': "Invalid API key: You must be granted a valid key."}
+RATE_LIMITED = {'success': False, 'status_code': 25,
+                'status_message': "Your request count (#) is over the allowed limit of (40)."}
+SERVER_ERROR = {'success': False, 'status_code': 11, 'status_message': "Internal error: Something went wrong."}
+
+
+def fake_metadata(movie_id):
+    """Deterministic TMDB-shaped record for any id"""
+    return {'id': movie_id, 'poster_path': f"/fake-{movie_id}.jpg", 'vote_average': round(5 + movie_id % 50 / 10, 1)}
+
+
+def parse_latency(spec):
+    """A function of a random.Random returning one delay in seconds, from a spec (see the module docstring)"""
+    kind, _, values = spec.partition(':') if ':' in spec else ('fixed', '', spec)
+    try:
+        params = [float(v) for v in values.split(',')]
+    except ValueError:
+        raise ValueError(f"Bad latency spec {spec!r}") from None
+    samplers = {
+        'fixed': (1, lambda rng, seconds: seconds),
+        'uniform': (2, lambda rng, low, high: rng.uniform(low, high)),
+        'normal': (2, lambda rng, mean, sd: rng.gauss(mean, sd)),
+        'lognormal': (2, lambda rng, median, sigma: rng.lognormvariate(math.log(median), sigma)),
+        'exponential': (1, lambda rng, mean: rng.expovariate(1 / mean)),
+    }
+    if kind not in samplers or len(params) != samplers[kind][0]:
+        raise ValueError(f"Bad latency spec {spec!r}")
+    sample = samplers[kind][1]
+    return lambda rng: max(0.0, sample(rng, *params))
+
+
+def load_fixture(path):
+    """{movie_id: record} from a fixture file"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return {int(movie_id): record for movie_id, record in data.items()}
+    return {int(record['id']): record for record in data}
+
+
+def write_fixture(path, artifact_dir=None):
+    """Write made-up records for every movie of the published bundle; returns how many"""
+    from artifacts import DEFAULT_ROOT, load_artifacts
+
+    artifacts = load_artifacts(artifact_dir or DEFAULT_ROOT, verify=False)
+    records = [fake_metadata(int(movie_id)) for movie_id in artifacts.get('movie_ids')]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(records, f)
+    return len(records)
+
+
+class FakeTMDB:
+    """What the server answers; shared by all handler threads"""
+
+    def __init__(self, fixture=None, latency='0', error_rate=0.0, throttle_rate=0.0, quota=None,
+                 retry_after=1, api_key=None, seed=0):
+        self.records = fixture
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.quota = TokenBucket(quota) if quota else None
+        self.retry_after = retry_after
+        self.api_key = api_key
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """(delay, throttled, error status or None) for one request, from the seeded generator"""
+        with self._lock:
+            delay = self.latency(self._rng)
+            throttled = self._rng.random() < self.throttle_rate
+            error = self._rng.choice((500, 503)) if self._rng.random() < self.error_rate else None
+        return delay, throttled, error
+
+    def count(self, status):
+        with self._lock:
+            self.stats[status] += 1
+
+    def respond(self, movie_id, query):
+        """(status, body, extra headers) for GET /3/movie/{movie_id}; sleeps for the drawn latency first"""
+        if self.api_key is not None and query.get('api_key', [None])[0] != self.api_key:
+            return 401, INVALID_KEY, {}
+        delay, throttled, error = self.draw()
+        # Like TMDB, turn rate-limited requests away without doing the work
+        if throttled or (self.quota is not None and self.quota.reserve(0) is None):
+            return 429, RATE_LIMITED, {'Retry-After': str(self.retry_after)}
+        time.sleep(delay)
+        if error is not None:
+            return error, SERVER_ERROR, {}
+        if self.records is None:
+            return 200, fake_metadata(movie_id), {}
+        record = self.records.get(movie_id)
+        return (200, record, {}) if record is not None else (404, NOT_FOUND, {})
+
+
+class FakeTMDBHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        tmdb = self.server.tmdb
+        if url.path == '/stats':
+            return self.send_json(200, {str(status): count for status, count in tmdb.stats.items()}, count=False)
+        match = MOVIE_PATH.match(url.path)
+        if match is None:
+            return self.send_json(404, NOT_FOUND)
+        self.send_json(*tmdb.respond(int(match.group(1)), parse_qs(url.query)))
+
+    def send_json(self, status, payload, headers=None, count=True):
+        if count:
+            self.server.tmdb.count(status)
+        body = json.dumps(payload).encode('utf-8')
+        headers = dict(headers or {}, **{'Content-Type': 'application/json;charset=utf-8',
+                                         'Content-Length': len(body)})
+        head = f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        # Headers and body in one write: separate small writes stall on Nagle/delayed ACK
+        self.wfile.write(head.encode('latin-1') + b"\r\n" + body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTMDBServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once
+    request_queue_size = 1024
+
+    def __init__(self, address, tmdb):
+        super().__init__(address, FakeTMDBHandler)
+        self.tmdb = tmdb
+
+
+def serve(host='127.0.0.1', port=5088, tmdb=None):
+    server = FakeTMDBServer((host, port), tmdb or FakeTMDB())
+    print(f"Fake TMDB listening on http://{host}:{server.server_port}/3", flush=True)
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake TMDB /3/movie/{id} endpoint")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5088)
+    parser.add_argument('--fixture', help="JSON file of movie records (default: make one up for any id)")
+    parser.add_argument('--latency', default='0', help="delay per response, e.g. 0.05 or lognormal:0.08,0.5")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered 500/503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument('--quota', type=float, default=None, help="requests per second above which to answer 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument('--api-key', default=None, help="only accept this api_key (default: any)")
+    parser.add_argument('--seed', type=int, default=0, help="seed for latencies, errors and throttling")
+    parser.add_argument('--write-fixture', metavar='PATH',
+                        help="write a fixture for every movie of an artifact bundle and exit")
+    parser.add_argument('--artifact-dir', default=None, help="bundle root for --write-fixture")
+    args = parser.parse_args()
+
+    if args.write_fixture:
+        count = write_fixture(args.write_fixture, args.artifact_dir)
+        print(f"Wrote {count} records to {args.write_fixture}")
+        return
+
+    try:
+        tmdb = FakeTMDB(load_fixture(args.fixture) if args.fixture else None, args.latency, args.error_rate,
+                        args.throttle_rate, args.quota, args.retry_after, args.api_key, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        serve(args.host, args.port, tmdb)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
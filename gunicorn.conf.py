@@ -0,0 +1,56 @@
+"""
+gunicorn settings for both serving modes.
+
+    gunicorn -c gunicorn.conf.py                      # sync: main:app on threaded workers
+    SERVER_MODE=async gunicorn -c gunicorn.conf.py    # async: asgi:app on uvicorn workers
+
+Sync mode blocks a thread per request for its whole TMDB wait, so its
+concurrency is workers * threads. Async mode (see asgi.py) keeps requests
+to /api/recommend, /api/recommend/stream and /api/movies as coroutines
+while they wait, so one worker per core handles hundreds of those at once;
+scale TMDB_ASYNC_CONNECTIONS and RANKING_WORKERS instead of adding workers.
+The other routes (batch, multi-seed, the catalog) still hold one of the
+worker's WSGI_THREADS threads per request, as in sync mode.
+
+Every worker memory-maps the same artifact bundle, so extra workers cost
+little memory beyond their title index and caches. Each one loads the
+catalog after forking and then follows newly published versions on its
+own (see reload_catalog in main.py); SIGHUP to the master restarts workers
+gracefully, which also picks up a new version.
+
+Everything below can be overridden with the usual GUNICORN_CMD_ARGS or
+command-line flags.
+"""
+import multiprocessing
+import os
+
+SERVER_MODE = os.getenv("SERVER_MODE", "sync")
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+cores = multiprocessing.cpu_count()
+
+if SERVER_MODE == "async":
+    wsgi_app = "asgi:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+    workers = int(os.getenv("WEB_CONCURRENCY", cores))
+elif SERVER_MODE == "sync":
+    wsgi_app = "main:app"
+    worker_class = "gthread"
+    workers = int(os.getenv("WEB_CONCURRENCY", 2 * cores + 1))
+    # Each thread waits out at most one TMDB time budget per request
+    threads = int(os.getenv("THREADS", "8"))
+else:
+    raise ValueError(f"SERVER_MODE must be 'sync' or 'async', not {SERVER_MODE!r}")
+
+# A request gives up on TMDB after TMDB_TIME_BUDGET (2.5 s by default); leave room for ranking
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+
+def post_worker_init(worker):
+    """Load the artifact bundle in every worker; main.py only does this itself under `python main.py`"""
+    import main
+
+    main.load_data()
+    main.start_reload_triggers()
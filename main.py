@@ -1,96 +1,277 @@
-from flask import Flask, render_template, request, jsonify
-import pickle
-import requests
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
+import gzip
+import hashlib
+import hmac
+import json
+import numpy as np
 import os
+import signal
+import threading
+import time
 from werkzeug.exceptions import RequestEntityTooLarge
 
+from artifacts import ArtifactError, DEFAULT_ROOT, current_version, publish
+from catalog import Catalog
+from ranking import top_k, top_k_rows
+from response_cache import ResponseCache
+from single_flight import SingleFlight
+from title_index import Match
+import tmdb
+from tmdb import POSTER_ERROR, fetch_as_completed, fetch_many
+
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-# Global variables to store loaded data
-movies = None
-similarity = None
+# Directory holding the versioned artifact bundles (see artifacts.py)
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", DEFAULT_ROOT)
+# Checksums are verified when a file is first loaded; set ARTIFACT_VERIFY=0 to skip
+ARTIFACT_VERIFY = os.getenv("ARTIFACT_VERIFY", "1") != "0"
+# Seconds between checks for a newly published version (artifacts/CURRENT); 0 disables the watcher
+ARTIFACT_WATCH_INTERVAL = float(os.getenv("ARTIFACT_WATCH_INTERVAL", "5"))
+# How long a replaced version may keep serving the requests that started on it
+RELOAD_DRAIN_TIMEOUT = float(os.getenv("RELOAD_DRAIN_TIMEOUT", "60"))
+# Bearer token for POST /admin/reload; the endpoint is disabled when unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# How recommendations past the precomputed neighbors are scored: 'exact' scores every movie,
+# 'approx' only the candidates from the ANN index (see ann.py). Clients may override per request.
+# Pages within the stored top-K always come from the neighbor lists; to approximate those too,
+# build them with `build.py --ann-neighbors`.
+RECOMMEND_MODE = os.getenv("RECOMMEND_MODE", "exact")
+RECOMMEND_MODES = ('exact', 'approx')
+
+# Recommendations returned per request, and the most a client may page in one call
+DEFAULT_RECOMMENDATIONS = 5
+MAX_RECOMMENDATIONS = 50
+# Most seed movies accepted by one /api/recommend/batch or /api/recommend/multi call
+MAX_BATCH_SIZE = 100
+# How strongly disliked seeds push their neighbors down, relative to liked ones
+DISLIKE_WEIGHT = 0.5
+
+# Cached /api/recommend results (entries per worker) and how long clients may reuse a response
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "4096"))
+RESPONSE_CACHE_MAX_AGE = int(os.getenv("RESPONSE_CACHE_MAX_AGE", "300"))
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+# Concurrent cache misses for the same ranking wait for one computation instead of repeating it
+recommend_flight = SingleFlight()
+
+# Titles per /api/movies/catalog page, the most a client may ask for, and how long clients may reuse a page
+CATALOG_PAGE_SIZE = 5000
+MAX_CATALOG_PAGE_SIZE = 20000
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "3600"))
+
+# Encoded (and possibly gzipped) catalog pages, dropped whenever the artifact version changes
+catalog_cache = ResponseCache(64)
+
+# The catalog new requests are served from (see catalog.py); replaced as a whole by reload_catalog()
+catalog = None
+# Replaced catalogs still finishing the requests that started on them
+draining = []
+catalog_lock = threading.Lock()
+reload_lock = threading.Lock()
+reload_triggers_started = False
 
 
 def load_data():
-    """Load pickle files on app startup"""
-    global movies, similarity
+    """Open the published artifact bundle on app startup"""
     try:
-        # Update these paths to match your pickle file locations
-        movies = pickle.load(open("c:\Users\sumit\ml_projects\movie_recommendation\movie_list.pkl", 'rb'))
-        similarity = pickle.load(open("c:\Users\sumit\ml_projects\movie_recommendation\similarity.pkl", 'rb'))
-        print(f"Loaded {len(movies)} movies successfully!")
-    except FileNotFoundError as e:
-        print(f"Error loading pickle files: {e}")
-        print("Make sure movie_list.pkl and similarity.pkl are in the same directory as this script")
-
-import os
-import requests
+        reload_catalog()
+    except (OSError, ArtifactError) as e:
+        print(f"Error loading artifacts: {e}")
+        print("Build them with: python artifacts.py convert --movies movie_list.pkl")
 
-TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 
-import os
-import requests
-
-def fetch_poster_and_rating(movie_id):
+def reload_catalog(version=None, publish_version=False):
     """
-    Fetch poster and rating from TMDB API using environment variable for API key.
-    Returns a tuple: (poster_url, rating)
+    Load a version (the published one by default) and swap it in for new requests; requests
+    already running finish on the version they started with. Returns the active catalog.
+    With publish_version, the version is also published once it has loaded, so the watchers of
+    every worker follow it instead of switching back to the old CURRENT.
+    If the new version fails to load, OSError/ArtifactError is raised and nothing changes.
     """
-    try:
-        # Get API key from environment variable
-        TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-        if not TMDB_API_KEY:
-            raise ValueError("TMDB_API_KEY environment variable not set.")
-
-        # Build URL
-        url = f"https://api.themoviedb.org/3/movie/{movie_id}?api_key={TMDB_API_KEY}&language=en-US"
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-
-        # Poster URL
-        if data.get('poster_path'):
-            full_path = "https://image.tmdb.org/t/p/w500/" + data['poster_path']
-        else:
-            full_path = "https://via.placeholder.com/500x750?text=No+Poster"
-
-        # Rating
-        rating = data.get('vote_average', 'N/A')
-
-        return full_path, rating
-
-    except requests.exceptions.RequestException as req_err:
-        print(f"Request error for movie_id {movie_id}: {req_err}")
-    except Exception as e:
-        print(f"Error fetching data for movie_id {movie_id}: {e}")
-
-    # Fallback values if error occurs
-    return "https://via.placeholder.com/500x750?text=Error+Loading", "N/A"
+    global catalog
+    with reload_lock:
+        version = version or current_version(ARTIFACT_DIR)
+        if catalog is not None and catalog.version == version:
+            if publish_version:
+                publish(ARTIFACT_DIR, version)
+            return catalog
+
+        loaded = Catalog.load(ARTIFACT_DIR, version, verify=ARTIFACT_VERIFY)
+        if publish_version:
+            publish(ARTIFACT_DIR, version)
+        with catalog_lock:
+            replaced, catalog = catalog, loaded
+            if replaced is not None:
+                draining.append(replaced)
+            response_cache.activate(loaded.version)
+            catalog_cache.activate(loaded.version)
+        print(f"Loaded {len(loaded)} movies (artifact version {loaded.version}) successfully!")
+
+        if replaced is not None:
+            threading.Thread(target=retire_catalog, args=(replaced,), daemon=True).start()
+        return loaded
+
+
+def retire_catalog(replaced):
+    """Wait for the requests still on a replaced catalog, then let it go"""
+    if not replaced.wait_idle(RELOAD_DRAIN_TIMEOUT):
+        print(f"Retiring artifact version {replaced.version} with {replaced.in_flight} requests still running")
+    with catalog_lock:
+        draining.remove(replaced)
+    print(f"Retired artifact version {replaced.version}")
+
+
+def reload_in_background():
+    """reload_catalog() off the calling thread, logging instead of raising"""
+    def run():
+        try:
+            reload_catalog()
+        except (OSError, ArtifactError) as e:
+            print(f"Artifact reload failed, still serving the previous version: {e}")
+    threading.Thread(target=run, daemon=True).start()
+
+
+def watch_artifacts(interval):
+    """Reload whenever a different version is published"""
+    last_error = None
+    while True:
+        time.sleep(interval)
+        try:
+            if catalog is None or current_version(ARTIFACT_DIR) != catalog.version:
+                reload_catalog()
+            last_error = None
+        except (OSError, ArtifactError) as e:
+            if str(e) != last_error:
+                print(f"Artifact reload failed, still serving the previous version: {e}")
+            last_error = str(e)
+
+
+def start_reload_triggers():
+    """Reload on SIGHUP and, unless ARTIFACT_WATCH_INTERVAL is 0, when CURRENT changes"""
+    global reload_triggers_started
+    if reload_triggers_started:
+        return
+    reload_triggers_started = True
+    if hasattr(signal, 'SIGHUP'):
+        try:
+            signal.signal(signal.SIGHUP, lambda signum, frame: reload_in_background())
+        except ValueError:
+            pass  # signal handlers can only be installed from the main thread
+    if ARTIFACT_WATCH_INTERVAL > 0:
+        threading.Thread(target=watch_artifacts, args=(ARTIFACT_WATCH_INTERVAL,), daemon=True).start()
+
+
+def artifact_status():
+    """The active version and any replaced ones still draining"""
+    with catalog_lock:
+        active, old = catalog, list(draining)
+    return {
+        'version': active.version if active else None,
+        'num_movies': len(active) if active else 0,
+        'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(active.loaded_at)) if active else None,
+        'in_flight': active.in_flight if active else 0,
+        'draining': [{'version': c.version, 'in_flight': c.in_flight} for c in old],
+    }
+
+
+def acquire_catalog():
+    """The current catalog, counted as in use until release() (None if nothing is loaded)"""
+    with catalog_lock:
+        return catalog.acquire() if catalog is not None else None
+
+
+@app.before_request
+def pin_catalog():
+    """Serve the whole request from the catalog that is current when it starts"""
+    g.catalog = acquire_catalog()
+
+
+@app.teardown_request
+def release_catalog(exc):
+    pinned = g.pop('catalog', None)
+    if pinned is not None:
+        pinned.release()
+
+
+@app.after_request
+def add_version_header(response):
+    pinned = g.get('catalog')
+    if pinned is not None:
+        response.headers['X-Artifact-Version'] = pinned.version
+    return response
+
+
+def rank_neighbors(catalog, index, k=DEFAULT_RECOMMENDATIONS, offset=0, mode=None):
+    """Row positions of the movies ranked offset .. offset+k-1 for row `index`, excluding itself"""
+    return rank_neighbors_batch(catalog, [index], k, offset, mode)[0]
+
+
+def rank_neighbors_batch(catalog, indices, k=DEFAULT_RECOMMENDATIONS, offset=0, mode=None):
+    """rank_neighbors() for several rows at once: one row-gather or one batched top-k"""
+    artifacts, vectors, ann_index = catalog.artifacts, catalog.vectors, catalog.ann_index
+    indices = np.asarray(indices, dtype=np.intp)
+    if artifacts.has('neighbor_ids'):
+        neighbor_ids = artifacts.get('neighbor_ids')
+        if offset + k <= neighbor_ids.shape[1] or (vectors is None and not artifacts.has('similarity')):
+            # Precomputed neighbors are already ranked and exclude the movie itself
+            return neighbor_ids[indices, offset:offset + k]
+    if (mode or RECOMMEND_MODE) == 'approx' and ann_index is not None and vectors is not None:
+        return [ann_index.search(vectors, index, k, offset=offset) for index in indices]
+    if vectors is not None:
+        # Sparse products: O(nnz) per row instead of rows of an N x N matrix
+        scores = vectors.similarities_many(indices)
+    else:
+        scores = artifacts.get('similarity')[indices]
+    ids, _ = top_k_rows(scores, offset + k, exclude=indices)
+    return ids[:, offset:]
 
 
-def recommend(movie):
-    """Generate movie recommendations"""
+def recommend(catalog, movie, k=DEFAULT_RECOMMENDATIONS, offset=0, mode=None):
+    """
+    Generate movie recommendations.
+    Returns (match, names, posters, ratings); match describes the title the input resolved to, or None.
+    """
+    # Find the movie in the dataset: exact title, then substring, then fuzzy
+    match = catalog.title_index.resolve(movie)
+    if match is None:
+        return None, [], [], []
+
+    # Every spelling that resolves to the same movie shares one cache entry
+    key = (match.row, k, offset, mode or RECOMMEND_MODE)
+    result = response_cache.get(catalog.version, key)
+    if result is None:
+        result = recommend_flight.do((catalog.version,) + key, recommend_and_cache, catalog, key)
+    return (match,) + result
+
+
+def recommend_and_cache(catalog, key):
+    """recommend_index() for a response cache key, storing the result unless it holds placeholders"""
+    row, k, offset, mode = key
+    result = recommend_index(catalog, row, k, offset, mode)
+    names, posters, _ = result
+    # Don't pin placeholders from a TMDB error or an exhausted time budget
+    if names and POSTER_ERROR not in posters:
+        response_cache.put(catalog.version, key, result)
+    return result
+
+
+def recommend_index(catalog, index, k=DEFAULT_RECOMMENDATIONS, offset=0, mode=None):
+    """Recommendations for the movie at row position `index`"""
     try:
-        # Find the movie in the dataset
-        movie_matches = movies[movies['title'].str.contains(movie, case=False, na=False)]
-
-        if movie_matches.empty:
-            return [], [], []
-
-        index = movie_matches.index[0]
-        distances = sorted(list(enumerate(similarity[index])), reverse=True, key=lambda x: x[1])
+        top_indices = rank_neighbors(catalog, index, k, offset, mode)
 
         recommended_movie_names = []
         recommended_movie_posters = []
         recommended_movie_ratings = []
 
-        # Get top 5 recommendations (excluding the input movie itself)
-        for i in distances[1:6]:
-            movie_id = movies.iloc[i[0]].movie_id
-            poster, rating = fetch_poster_and_rating(movie_id)
+        # Get top k recommendations (excluding the input movie itself)
+        catalog_ids = catalog.artifacts.get('movie_ids')
+        movie_ids = [int(catalog_ids[i]) for i in top_indices]
+        for i, (poster, rating) in zip(top_indices, fetch_many(movie_ids)):
             recommended_movie_posters.append(poster)
-            recommended_movie_names.append(movies.iloc[i[0]].title)
+            recommended_movie_names.append(catalog.title_index.titles[i])
             recommended_movie_ratings.append(rating)
 
         return recommended_movie_names, recommended_movie_posters, recommended_movie_ratings
@@ -99,56 +280,389 @@ def recommend(movie):
         return [], [], []
 
 
+def rank_multi_seed(catalog, liked, disliked=(), k=DEFAULT_RECOMMENDATIONS, offset=0):
+    """
+    Rows ranked offset .. offset+k-1 for several seed rows at once: the mean similarity to
+    the liked seeds minus DISLIKE_WEIGHT times the mean similarity to the disliked ones.
+    Seeds themselves are never returned.
+    """
+    seeds = np.asarray(list(liked) + list(disliked), dtype=np.intp)
+    weights = np.concatenate([
+        np.full(len(liked), 1.0 / len(liked)),
+        np.full(len(disliked), -DISLIKE_WEIGHT / max(len(disliked), 1)),
+    ])
+
+    artifacts, vectors = catalog.artifacts, catalog.vectors
+
+    if vectors is not None:
+        scores = weights @ vectors.similarities_many(seeds)
+    elif artifacts.has('similarity'):
+        scores = weights @ np.asarray(artifacts.get('similarity')[seeds], dtype=np.float64)
+    else:
+        # Only the top-K lists are available: accumulate the scores they do hold
+        scores = np.zeros(len(artifacts), dtype=np.float64)
+        neighbor_scores = artifacts.get('neighbor_scores')[seeds] * weights[:, None]
+        np.add.at(scores, artifacts.get('neighbor_ids')[seeds], neighbor_scores)
+
+    return top_k(scores, k, offset=offset, exclude=seeds)
+
+
+def parse_ranking_options(data):
+    """Read k, offset and mode from a request body; raises ValueError with a client-facing message"""
+    try:
+        k = int(data.get('k', DEFAULT_RECOMMENDATIONS))
+        offset = int(data.get('offset', 0))
+    except (TypeError, ValueError):
+        raise ValueError('k and offset must be integers')
+    if not 1 <= k <= MAX_RECOMMENDATIONS or offset < 0:
+        raise ValueError(f'k must be between 1 and {MAX_RECOMMENDATIONS} and offset must be >= 0')
+
+    mode = data.get('mode', RECOMMEND_MODE)
+    if mode not in RECOMMEND_MODES:
+        raise ValueError(f"mode must be one of {', '.join(RECOMMEND_MODES)}")
+    return k, offset, mode
+
+
+def resolve_seed(catalog, seed):
+    """Resolve a title string or TMDB movie id to a Match; raises ValueError if it is unknown"""
+    if isinstance(seed, int) and not isinstance(seed, bool):
+        row = catalog.row_by_movie_id.get(seed)
+        if row is None:
+            raise ValueError(f'Unknown movie id {seed}')
+        return Match(row, catalog.title_index.titles[row], 'id', 1.0)
+    if not isinstance(seed, str) or not seed.strip():
+        raise ValueError('Each movie must be a title or a TMDB movie id')
+    match = catalog.title_index.resolve(seed)
+    if match is None:
+        raise ValueError(f'No movie matches {seed!r}')
+    return match
+
+
 @app.route('/')
 def index():
     """Main page"""
-    if movies is None:
-        return render_template('error.html', error="Movie data not loaded. Please check pickle files.")
+    if g.catalog is None:
+        return render_template('error.html', error="Movie data not loaded. Please check the artifact bundle.")
     return render_template('index.html')
 
 
 @app.route('/api/movies')
 def get_movies():
-    """API endpoint to get all movie titles for autocomplete"""
-    if movies is None:
+    """API endpoint to search movie titles for autocomplete (see /api/movies/catalog for the full list)"""
+    catalog = g.catalog
+    if catalog is None:
         return jsonify({'error': 'Movie data not loaded'}), 500
 
     query = request.args.get('q', '').lower()
     if query:
-        filtered_movies = movies[movies['title'].str.contains(query, case=False, na=False)]['title'].tolist()
-        return jsonify(filtered_movies[:20])  # Limit to 20 results
+        titles = catalog.title_index.titles
+        filtered_movies = [titles[i] for i in catalog.title_index.search(query, limit=20)]
+        return jsonify(filtered_movies)  # Limit to 20 results
     else:
-        return jsonify(movies['title'].tolist()[:50])  # Return first 50 movies
+        return jsonify(catalog.title_index.titles[:50])  # Return first 50 movies
+
+
+def catalog_page(catalog, page, per_page, use_gzip):
+    """Encoded body of one catalog page: parallel id and title arrays in row order"""
+    key = (page, per_page, use_gzip)
+    body = catalog_cache.get(catalog.version, key)
+    if body is None:
+        start = (page - 1) * per_page
+        stop = min(start + per_page, len(catalog))
+        body = json.dumps({
+            'version': catalog.version,
+            'total': len(catalog),
+            'page': page,
+            'pages': max(1, -(-len(catalog) // per_page)),
+            'ids': catalog.artifacts.get('movie_ids')[start:stop].tolist(),
+            'titles': catalog.title_index.titles[start:stop],
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        if use_gzip:
+            body = gzip.compress(body, compresslevel=6)
+        catalog_cache.put(catalog.version, key, body)
+    return body
+
+
+@app.route('/api/movies/catalog')
+def get_catalog():
+    """
+    The whole catalog as compact pages of ids and titles, so the page can search it locally.
+    Pages only change with the artifact version, so they carry an ETag and are gzipped when accepted.
+    """
+    catalog = g.catalog
+    if catalog is None:
+        return jsonify({'error': 'Movie data not loaded'}), 500
+
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', CATALOG_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+    pages = max(1, -(-len(catalog) // max(per_page, 1)))
+    if not 1 <= per_page <= MAX_CATALOG_PAGE_SIZE or not 1 <= page <= pages:
+        return jsonify({'error': f'per_page must be between 1 and {MAX_CATALOG_PAGE_SIZE} '
+                                 f'and page between 1 and {pages}'}), 400
+
+    use_gzip = 'gzip' in request.accept_encodings
+    response = Response(catalog_page(catalog, page, per_page, use_gzip), mimetype='application/json')
+    if use_gzip:
+        response.content_encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.set_etag(f"{catalog.version}-{page}-{per_page}{'-gz' if use_gzip else ''}")
+    response.cache_control.public = True
+    response.cache_control.max_age = CATALOG_MAX_AGE
+    return response.make_conditional(request)
+
+
+def recommendation_body(movie_name, match, names, posters, ratings):
+    """The JSON body of an /api/recommend response"""
+    recommendations = []
+    for i in range(len(names)):
+        recommendations.append({
+            'title': names[i],
+            'poster': posters[i],
+            'rating': ratings[i]
+        })
 
+    return {
+        'selected_movie': movie_name,
+        'matched_movie': match.title if match else None,
+        'match_type': match.match_type if match else None,
+        'recommendations': recommendations
+    }
 
-@app.route('/api/recommend', methods=['POST'])
+
+@app.route('/api/recommend', methods=['GET', 'POST'])
 def get_recommendations():
-    """API endpoint to get movie recommendations"""
-    if movies is None or similarity is None:
+    """API endpoint to get movie recommendations (GET responses are cacheable by clients)"""
+    catalog = g.catalog
+    if catalog is None:
         return jsonify({'error': 'Movie data not loaded'}), 500
 
-    data = request.get_json()
+    data = request.args if request.method == 'GET' else request.get_json()
     movie_name = data.get('movie', '')
 
     if not movie_name:
         return jsonify({'error': 'Movie name is required'}), 400
 
-    names, posters, ratings = recommend(movie_name)
+    try:
+        k, offset, mode = parse_ranking_options(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    recommendations = []
-    for i in range(len(names)):
-        recommendations.append({
-            'title': names[i],
-            'poster': posters[i],
-            'rating': ratings[i]
-        })
+    match, names, posters, ratings = recommend(catalog, movie_name, k, offset, mode)
+    response = jsonify(recommendation_body(movie_name, match, names, posters, ratings))
+
+    if names and POSTER_ERROR not in posters:
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+        response.cache_control.public = True
+        response.cache_control.max_age = RESPONSE_CACHE_MAX_AGE
+    else:
+        response.cache_control.no_store = True
+    # Answers If-None-Match on GET with 304 Not Modified
+    return response.make_conditional(request)
+
+
+@app.route('/api/recommend/stream', methods=['POST'])
+def stream_recommendations():
+    """
+    Streaming variant of /api/recommend as NDJSON: one 'ranking' line with the titles as soon as
+    they are ranked, one 'metadata' line per poster/rating as TMDB answers, then a 'done' line.
+    """
+    catalog = g.catalog
+    if catalog is None:
+        return jsonify({'error': 'Movie data not loaded'}), 500
+
+    data = request.get_json(silent=True) or {}
+    movie_name = data.get('movie', '')
+    if not movie_name:
+        return jsonify({'error': 'Movie name is required'}), 400
+
+    try:
+        k, offset, mode = parse_ranking_options(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    match = catalog.title_index.resolve(movie_name)
+    key = (match.row, k, offset, mode) if match else None
+    cached = response_cache.get(catalog.version, key) if match else None
+
+    def generate():
+        ranking = {
+            'type': 'ranking',
+            'selected_movie': movie_name,
+            'matched_movie': match.title if match else None,
+            'match_type': match.match_type if match else None,
+        }
+        if match is None:
+            yield json.dumps(dict(ranking, recommendations=[])) + '\n'
+        elif cached is not None:
+            # Already enriched: everything goes out in the first line
+            names, posters, ratings = cached
+            ranking['recommendations'] = [
+                {'rank': i, 'title': name, 'poster': poster, 'rating': rating}
+                for i, (name, poster, rating) in enumerate(zip(names, posters, ratings))
+            ]
+            yield json.dumps(ranking) + '\n'
+        else:
+            top_indices = rank_neighbors(catalog, match.row, k, offset, mode)
+            names = [catalog.title_index.titles[i] for i in top_indices]
+            ranking['recommendations'] = [{'rank': i, 'title': name} for i, name in enumerate(names)]
+            yield json.dumps(ranking) + '\n'
+
+            catalog_ids = catalog.artifacts.get('movie_ids')
+            posters, ratings = [None] * len(names), [None] * len(names)
+            for i, (poster, rating) in fetch_as_completed([int(catalog_ids[row]) for row in top_indices]):
+                posters[i], ratings[i] = poster, rating
+                yield json.dumps({'type': 'metadata', 'rank': i, 'poster': poster, 'rating': rating}) + '\n'
+
+            if names and POSTER_ERROR not in posters:
+                response_cache.put(catalog.version, key, (names, posters, ratings))
+        yield json.dumps({'type': 'done'}) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Ask reverse proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.cache_control.no_store = True
+    return response
+
+
+@app.route('/api/recommend/batch', methods=['POST'])
+def get_batch_recommendations():
+    """API endpoint to get recommendations for many titles or TMDB ids in one call"""
+    catalog = g.catalog
+    if catalog is None:
+        return jsonify({'error': 'Movie data not loaded'}), 500
+
+    data = request.get_json(silent=True) or {}
+    seeds = data.get('movies')
+    if not isinstance(seeds, list) or not seeds:
+        return jsonify({'error': 'movies must be a non-empty list of titles or ids'}), 400
+    if len(seeds) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} movies per batch'}), 400
+
+    try:
+        k, offset, mode = parse_ranking_options(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Resolve every seed first; failures become per-item errors
+    results = []
+    matches = []
+    for seed in seeds:
+        try:
+            match = resolve_seed(catalog, seed)
+            matches.append(match)
+            results.append({'movie': seed, 'matched_movie': match.title, 'match_type': match.match_type})
+        except ValueError as e:
+            results.append({'movie': seed, 'error': str(e)})
+
+    if matches:
+        ranked = rank_neighbors_batch(catalog, [match.row for match in matches], k, offset, mode)
+
+        # Enrich each distinct recommended movie once, however many seeds share it
+        catalog_ids = catalog.artifacts.get('movie_ids')
+        unique_rows = list(dict.fromkeys(int(i) for rows in ranked for i in rows))
+        metadata = dict(zip(unique_rows, fetch_many([int(catalog_ids[i]) for i in unique_rows])))
+
+        resolved = (result for result in results if 'error' not in result)
+        for result, rows in zip(resolved, ranked):
+            result['recommendations'] = [
+                {'title': catalog.title_index.titles[i], 'poster': metadata[int(i)][0], 'rating': metadata[int(i)][1]}
+                for i in rows
+            ]
+
+    return jsonify({'results': results})
+
+
+@app.route('/api/recommend/multi', methods=['POST'])
+def get_multi_seed_recommendations():
+    """API endpoint to get one list of recommendations for several liked (and disliked) movies"""
+    catalog = g.catalog
+    if catalog is None:
+        return jsonify({'error': 'Movie data not loaded'}), 500
+
+    data = request.get_json(silent=True) or {}
+    liked = data.get('liked')
+    disliked = data.get('disliked', [])
+    if not isinstance(liked, list) or not liked or not isinstance(disliked, list):
+        return jsonify({'error': 'liked must be a non-empty list of titles or ids, disliked a list'}), 400
+    if len(liked) + len(disliked) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} liked and disliked movies in total'}), 400
+
+    try:
+        k, offset, _ = parse_ranking_options(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    resolved = {'liked': [], 'disliked': []}
+    unmatched = []
+    for key, seeds in (('liked', liked), ('disliked', disliked)):
+        for seed in seeds:
+            try:
+                resolved[key].append((seed, resolve_seed(catalog, seed)))
+            except ValueError as e:
+                unmatched.append({'movie': seed, 'error': str(e)})
+
+    if not resolved['liked']:
+        return jsonify({'error': 'None of the liked movies could be found', 'unmatched': unmatched}), 404
+
+    liked_matches = [match for _, match in resolved['liked']]
+    liked_rows = list(dict.fromkeys(match.row for match in liked_matches))
+    # A movie both liked and disliked counts as liked; report the dislike as not applied
+    disliked_matches = []
+    for seed, match in resolved['disliked']:
+        if match.row in liked_rows:
+            unmatched.append({'movie': seed, 'error': f'{match.title!r} is also liked, so the dislike was ignored'})
+        else:
+            disliked_matches.append(match)
+    disliked_rows = list(dict.fromkeys(match.row for match in disliked_matches))
+    top_indices = rank_multi_seed(catalog, liked_rows, disliked_rows, k, offset)
+
+    catalog_ids = catalog.artifacts.get('movie_ids')
+    metadata = fetch_many([int(catalog_ids[i]) for i in top_indices])
+    recommendations = [
+        {'title': catalog.title_index.titles[i], 'poster': poster, 'rating': rating}
+        for i, (poster, rating) in zip(top_indices, metadata)
+    ]
 
     return jsonify({
-        'selected_movie': movie_name,
+        'liked': [match.title for match in liked_matches],
+        'disliked': [match.title for match in disliked_matches],
+        'unmatched': unmatched,
         'recommendations': recommendations
     })
 
 
+@app.route('/api/version')
+def get_version():
+    """The artifact version serving new requests, replaced versions still draining and TMDB client health"""
+    return jsonify(dict(artifact_status(), tmdb=tmdb.status()))
+
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """
+    Load the published version and swap it in, on the worker that receives the request (the
+    others pick it up with their watchers). A version named in the body is published first,
+    so every worker moves to it.
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Reloading over HTTP is disabled; set ADMIN_TOKEN to enable it'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {ADMIN_TOKEN}'):
+        return jsonify({'error': 'Invalid admin token'}), 403
+
+    version = (request.get_json(silent=True) or {}).get('version')
+    if version is not None and (not isinstance(version, str) or version != os.path.basename(version)
+                                or version.startswith('.')):
+        return jsonify({'error': 'version must be the name of a bundle directory'}), 400
+    try:
+        reload_catalog(version, publish_version=version is not None)
+    except (OSError, ArtifactError) as e:
+        return jsonify(dict(artifact_status(), error=f'Reload failed, still serving the previous version: {e}')), 500
+    return jsonify(artifact_status())
+
+
 # HTML Templates as strings
 templates = {
     'index.html': '''<!DOCTYPE html>
@@ -759,8 +1273,14 @@ templates = {
 
         async function loadMovies() {
             try {
-                const response = await fetch('/api/movies');
-                allMovies = await response.json();
+                // The catalog comes in pages; fetch the first to learn how many there are
+                const first = await fetch('/api/movies/catalog').then(r => r.json());
+                const rest = [];
+                for (let page = 2; page <= first.pages; page++) {
+                    rest.push(fetch(`/api/movies/catalog?page=${page}`).then(r => r.json()));
+                }
+                const pages = [first, ...await Promise.all(rest)];
+                allMovies = pages.flatMap(page => page.titles);
                 console.log('Movies loaded successfully');
             } catch (error) {
                 showError('Failed to load movie database');
@@ -843,7 +1363,8 @@ templates = {
             hideError();
 
             try {
-                const response = await fetch('/api/recommend', {
+                // Titles arrive as soon as they are ranked; posters and ratings follow one by one
+                const response = await fetch('/api/recommend/stream', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
@@ -851,35 +1372,43 @@ templates = {
                     body: JSON.stringify({ movie: movie })
                 });
 
-                const data = await response.json();
+                if (!response.ok) {
+                    const data = await response.json();
+                    throw new Error(data.error || 'Request failed');
+                }
 
-                if (data.error) {
-                    throw new Error(data.error);
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let ranked = [];
+
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split('\\n');
+                    buffer = lines.pop();
+
+                    for (const line of lines) {
+                        if (!line.trim()) continue;
+                        const event = JSON.parse(line);
+
+                        if (event.type === 'ranking') {
+                            loading.style.display = 'none';
+                            ranked = event.recommendations;
+                            if (ranked.length > 0) {
+                                renderMovieCards(ranked);
+                            }
+                        } else if (event.type === 'metadata') {
+                            updateMovieCard(event);
+                        }
+                    }
                 }
 
                 loading.style.display = 'none';
 
-                if (data.recommendations && data.recommendations.length > 0) {
-                    recommendations.innerHTML = data.recommendations.map((movie, index) => `
-                        <div class="movie-card" style="animation-delay: ${index * 0.15}s; opacity: 0;">
-                            <img src="${movie.poster}" alt="${movie.title}" class="movie-poster" 
-                                 onerror="this.src='https://via.placeholder.com/500x750/1a1a1a/ffffff?text=${encodeURIComponent(movie.title)}'">
-                            <div class="movie-title">${movie.title}</div>
-                            <div class="movie-rating">
-                                <span class="rating-star">⭐</span>
-                                <span class="rating-value">${movie.rating}/10</span>
-                            </div>
-                        </div>
-                    `).join('');
-
-                    // Animate cards in
-                    const cards = recommendations.querySelectorAll('.movie-card');
-                    cards.forEach((card, index) => {
-                        setTimeout(() => {
-                            card.style.animation = 'fadeInUp 0.8s ease forwards';
-                        }, index * 100);
-                    });
-                } else {
+                if (ranked.length === 0) {
                     recommendations.innerHTML = `
                         <div style="text-align: center; color: #666; grid-column: 1/-1; padding: 60px;">
                             <div style="font-size: 4rem; margin-bottom: 20px;">🤔</div>
@@ -898,6 +1427,36 @@ templates = {
             }
         }
 
+        function renderMovieCards(movies) {
+            const recommendations = document.getElementById('recommendations');
+            recommendations.innerHTML = movies.map((movie, index) => `
+                <div class="movie-card" data-rank="${movie.rank}" style="animation-delay: ${index * 0.15}s; opacity: 0;">
+                    <img src="${movie.poster || 'https://via.placeholder.com/500x750/1a1a1a/ffffff?text=Loading...'}" alt="${movie.title}" class="movie-poster" 
+                         onerror="this.src='https://via.placeholder.com/500x750/1a1a1a/ffffff?text=${encodeURIComponent(movie.title)}'">
+                    <div class="movie-title">${movie.title}</div>
+                    <div class="movie-rating">
+                        <span class="rating-star">⭐</span>
+                        <span class="rating-value">${movie.rating !== undefined ? movie.rating + '/10' : '…'}</span>
+                    </div>
+                </div>
+            `).join('');
+
+            // Animate cards in
+            const cards = recommendations.querySelectorAll('.movie-card');
+            cards.forEach((card, index) => {
+                setTimeout(() => {
+                    card.style.animation = 'fadeInUp 0.8s ease forwards';
+                }, index * 100);
+            });
+        }
+
+        function updateMovieCard(event) {
+            const card = document.querySelector(`.movie-card[data-rank="${event.rank}"]`);
+            if (!card) return;
+            card.querySelector('.movie-poster').src = event.poster;
+            card.querySelector('.rating-value').textContent = event.rating + '/10';
+        }
+
         function showError(message) {
             const errorDiv = document.getElementById('errorMessage');
             errorDiv.innerHTML = message;
@@ -1126,8 +1685,8 @@ templates = {
 
         <p><strong>Please make sure:</strong></p>
         <ul>
-            <li>movie_list.pkl and similarity.pkl files are in the same directory as app.py</li>
-            <li>The pickle files contain the correct data structure</li>
+            <li>An artifact bundle has been built with python artifacts.py convert</li>
+            <li>python artifacts.py verify reports every file as OK</li>
             <li>You have an active internet connection for movie posters</li>
             <li>All required Python packages are installed</li>
         </ul>
@@ -1154,15 +1713,15 @@ if __name__ == '__main__':
     # Create templates directory and files
     create_templates()
 
-    # Load data on startup
+    # Load data on startup, then pick up newly published versions without a restart
     load_data()
+    start_reload_triggers()
 
     print("🎬 CineAI Movie Recommendation System")
     print("=" * 60)
     print("🚀 Starting Flask server with modern black design...")
     print("📋 Requirements checklist:")
-    print("   ✓ movie_list.pkl")
-    print("   ✓ similarity.pkl")
+    print("   ✓ artifacts/ bundle (python artifacts.py convert)")
     print("   ✓ Active internet connection")
     print("=" * 60)
     print("🌐 Server will start at: http://localhost:5000")
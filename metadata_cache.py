@@ -0,0 +1,129 @@
+"""
+Persistent TMDB metadata cache.
+
+Rows live in a small SQLite database (WAL mode) so they survive restarts and
+are shared by every gunicorn worker on the host. Each process keeps a bounded
+LRU dict in front of it, so popular titles are served without touching disk.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 7 * 24 * 3600  # posters and ratings rarely change
+DEFAULT_LRU_SIZE = 2048
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tmdb_metadata (
+    movie_id     INTEGER PRIMARY KEY,
+    poster_path  TEXT,
+    vote_average REAL,
+    fetched_at   REAL NOT NULL
+)
+"""
+
+
+class MetadataCache:
+    """movie_id -> (poster_path, vote_average) with a TTL and an in-process LRU layer"""
+
+    def __init__(self, path, ttl=DEFAULT_TTL, lru_size=DEFAULT_LRU_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self):
+        """One SQLite connection per thread, created on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, movie_id, entry):
+        with self._lock:
+            self._lru[movie_id] = entry
+            self._lru.move_to_end(movie_id)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _lookup_memory(self, movie_id):
+        with self._lock:
+            entry = self._lru.get(movie_id)
+            if entry is not None:
+                self._lru.move_to_end(movie_id)
+        return entry
+
+    def _value(self, entry, stale):
+        value, fetched_at = entry
+        if time.time() - fetched_at > self.ttl and not stale:
+            return None
+        return value
+
+    def peek(self, movie_id, stale=False):
+        """get() answered from the in-process LRU only, never touching SQLite; None on a miss"""
+        entry = self._lookup_memory(int(movie_id))
+        return self._value(entry, stale) if entry is not None else None
+
+    def get(self, movie_id, stale=False):
+        """
+        Return (poster_path, vote_average) or None if missing or expired.
+        stale=True also returns expired entries, for when TMDB can't be asked.
+        """
+        movie_id = int(movie_id)
+        entry = self._lookup_memory(movie_id)
+        if entry is None:
+            try:
+                row = self._connection().execute(
+                    "SELECT poster_path, vote_average, fetched_at FROM tmdb_metadata WHERE movie_id = ?",
+                    (movie_id,)).fetchone()
+            except sqlite3.Error as e:
+                print(f"Metadata cache read failed for movie_id {movie_id}: {e}")
+                return None
+            if row is None:
+                return None
+            entry = ((row[0], row[1]), row[2])
+            self._remember(movie_id, entry)
+        return self._value(entry, stale)
+
+    def put(self, movie_id, poster_path, vote_average):
+        """Store one lookup result"""
+        self.put_many([(movie_id, poster_path, vote_average)])
+
+    def put_many(self, rows):
+        """Store (movie_id, poster_path, vote_average) rows in one transaction"""
+        now = time.time()
+        rows = [(int(movie_id), poster_path, vote_average, now) for movie_id, poster_path, vote_average in rows]
+        try:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO tmdb_metadata (movie_id, poster_path, vote_average, fetched_at) "
+                    "VALUES (?, ?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            print(f"Metadata cache write failed: {e}")
+            return
+        for movie_id, poster_path, vote_average, fetched_at in rows:
+            self._remember(movie_id, ((poster_path, vote_average), fetched_at))
+
+    def fresh_ids(self):
+        """Set of movie_ids with an unexpired row on disk"""
+        rows = self._connection().execute(
+            "SELECT movie_id FROM tmdb_metadata WHERE fetched_at >= ?", (time.time() - self.ttl,))
+        return {row[0] for row in rows}
+
+    def prune(self):
+        """Delete expired rows from disk; returns how many were removed"""
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute("DELETE FROM tmdb_metadata WHERE fetched_at < ?", (time.time() - self.ttl,))
+        return cursor.rowcount
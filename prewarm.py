@@ -0,0 +1,120 @@
+"""
+Bulk pre-warm of the TMDB metadata cache.
+
+Walks every movie_id in the published artifact bundle and fetches its poster and rating with
+bounded concurrency and at most --rate requests per second (TMDB_RATE_LIMIT by default, the
+same limit the server keeps to), retrying transient failures with exponential backoff.
+Results go into the same SQLite store that fetch_poster_and_rating() reads
+first (see metadata_cache.py). Ids that already have a fresh entry are
+skipped, so an interrupted run simply resumes where it stopped.
+
+Usage:
+    TMDB_API_KEY=... python prewarm.py [--artifact-dir artifacts] [--version VERSION] --concurrency 8 [--rate 40]
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+import tmdb
+from artifacts import ArtifactError, DEFAULT_ROOT, load_artifacts
+from resilience import TokenBucket
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def fetch_with_retry(movie_id, retries=5, backoff=0.5, rate_limit=None):
+    """
+    Fetch (poster_path, vote_average), retrying 429/5xx and connection errors; every attempt
+    first waits for a token from rate_limit, if given. Returns None if the movie could not be fetched.
+    """
+    for attempt in range(retries + 1):
+        if rate_limit is not None:
+            rate_limit.acquire(float('inf'))
+        try:
+            return tmdb.request_metadata(movie_id)
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status == 404:
+                # Unknown to TMDB: cache the absence so we don't ask again
+                return None, None
+            if status not in RETRY_STATUSES or attempt == retries:
+                print(f"Giving up on movie_id {movie_id}: {e}")
+                return None
+            retry_after = e.response.headers.get('Retry-After')
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff * 2 ** attempt
+        except requests.exceptions.RequestException as e:
+            if attempt == retries:
+                print(f"Giving up on movie_id {movie_id}: {e}")
+                return None
+            delay = backoff * 2 ** attempt
+        time.sleep(delay + random.uniform(0, backoff))
+    return None
+
+
+def prewarm(movie_ids, concurrency=8, batch_size=100, retries=5, rate=tmdb.TMDB_RATE_LIMIT):
+    """
+    Fetch every id not already fresh in the cache, at most rate requests per second
+    (no limit if rate is 0); returns (fetched, failed, skipped)
+    """
+    rate_limit = TokenBucket(rate) if rate > 0 else None
+    fresh = tmdb.cache.fresh_ids()
+    pending = [movie_id for movie_id in dict.fromkeys(int(m) for m in movie_ids) if movie_id not in fresh]
+    skipped = len(movie_ids) - len(pending)
+    print(f"{len(pending)} movies to fetch, {skipped} already cached")
+
+    fetched = failed = 0
+    batch = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(fetch_with_retry, movie_id, retries, rate_limit=rate_limit): movie_id
+                   for movie_id in pending}
+        for future in as_completed(futures):
+            result = future.result()
+            if result is None:
+                failed += 1
+            else:
+                batch.append((futures[future], *result))
+                fetched += 1
+
+            if len(batch) >= batch_size:
+                tmdb.cache.put_many(batch)
+                batch = []
+                elapsed = time.perf_counter() - started
+                print(f"  {fetched + failed}/{len(pending)} done, {(fetched + failed) / elapsed:.1f} movies/s")
+
+    if batch:
+        tmdb.cache.put_many(batch)
+
+    elapsed = time.perf_counter() - started
+    rate = (fetched + failed) / elapsed if elapsed else 0.0
+    print(f"Fetched {fetched}, failed {failed}, skipped {skipped} in {elapsed:.1f}s ({rate:.1f} movies/s)")
+    return fetched, failed, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fetch TMDB posters and ratings into the local cache")
+    parser.add_argument('--artifact-dir', default=os.getenv("ARTIFACT_DIR", DEFAULT_ROOT),
+                        help="directory holding the bundles")
+    parser.add_argument('--version', default=None, help="bundle version (default: the published one)")
+    parser.add_argument('--concurrency', type=int, default=8, help="parallel TMDB requests")
+    parser.add_argument('--rate', type=float, default=tmdb.TMDB_RATE_LIMIT,
+                        help="most TMDB requests per second, retries included (0: no limit)")
+    parser.add_argument('--retries', type=int, default=5, help="retries per movie on 429/5xx/network errors")
+    args = parser.parse_args()
+
+    if not os.getenv("TMDB_API_KEY"):
+        parser.error("TMDB_API_KEY environment variable not set.")
+    try:
+        movie_ids = load_artifacts(args.artifact_dir, args.version, verify=False).get('movie_ids')
+    except (OSError, ArtifactError) as e:
+        parser.error(f"Could not open the artifact bundle: {e}")
+
+    prewarm(movie_ids.tolist(), concurrency=args.concurrency, retries=args.retries, rate=args.rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Partial top-k selection over similarity scores.
+
+Both helpers return the same order as a stable descending sort
+(`sorted(enumerate(row), reverse=True, key=lambda x: x[1])`): highest score
+first, ties broken by ascending index. They only fully sort the handful of
+candidates that can make the cut, so a row of N scores costs O(N) instead of
+O(N log N) and never builds Python tuples.
+"""
+import numpy as np
+
+
+def top_k(scores, k, offset=0, exclude=None):
+    """
+    Return the indices ranked offset .. offset+k-1 in scores, best first.
+    exclude is an index or list of indices that must never be returned.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    n = scores.shape[0]
+    valid = n
+    if exclude is not None:
+        exclude = np.unique(np.atleast_1d(np.asarray(exclude, dtype=np.intp)))
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+        valid -= len(exclude)
+
+    stop = min(offset + k, valid)
+    if stop <= offset:
+        return np.empty(0, dtype=np.intp)
+
+    if stop < n:
+        # Every index scoring at least the stop-th best value is a candidate,
+        # so ties straddling the cut are resolved by index below
+        threshold = np.partition(scores, n - stop)[n - stop]
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(n)
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][offset:stop]
+
+
+def top_k_rows(matrix, k, exclude=None):
+    """
+    Row-wise top-k of a 2-D score block.
+    exclude optionally gives one column per row to skip (e.g. the row's own movie).
+    Returns (ids, scores) of shape (rows, k), best first.
+    """
+    block = np.array(matrix, dtype=np.result_type(matrix, np.float32))
+    rows, n = block.shape
+    if exclude is not None:
+        block[np.arange(rows), exclude] = -np.inf
+    k = max(0, min(k, n - (0 if exclude is None else 1)))
+    if k == 0:
+        return np.empty((rows, 0), dtype=np.intp), np.empty((rows, 0), dtype=block.dtype)
+
+    candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(block, candidates, axis=1)
+    order = np.lexsort((candidates, -candidate_scores), axis=1)
+    ids = np.take_along_axis(candidates, order, axis=1)
+    scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+    # argpartition picks arbitrarily among values tied at the cut; redo those rows exactly
+    tied = np.flatnonzero((block >= scores[:, -1:]).sum(axis=1) > k)
+    for row in tied:
+        ids[row] = top_k(block[row], k)
+        scores[row] = block[row, ids[row]]
+
+    return ids, scores
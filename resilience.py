@@ -0,0 +1,136 @@
+"""
+Guards for calls to a flaky upstream (TMDB): adaptive timeouts, a circuit
+breaker and a token bucket. All three are thread-safe and never block for
+longer than the caller allows, so they work from request threads and from
+the event loop of the async serving mode alike.
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class LatencyTracker:
+    """
+    Recent successful call latencies; timeout() is a high percentile of them times a margin,
+    so calls give up soon after they have become unusually slow instead of at a fixed ceiling.
+    """
+
+    def __init__(self, default, minimum=0.25, percentile=99, margin=2.0, window=500, min_samples=20):
+        self.default = default
+        self.minimum = minimum
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self):
+        """The tracked percentile of recent latencies, or None until there are enough samples"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = np.fromiter(self._samples, dtype=np.float64)
+        return float(np.percentile(samples, self.percentile))
+
+    def timeout(self):
+        """Timeout for the next call, between minimum and default"""
+        quantile = self.quantile()
+        if quantile is None:
+            return self.default
+        return min(self.default, max(self.minimum, quantile * self.margin))
+
+
+class CircuitBreaker:
+    """
+    closed: calls go through. After `failures` consecutive failures it opens: calls are refused
+    for `reset_after` seconds (or as long as the upstream asked). Then it is half-open: one probe
+    call goes through, and its outcome closes the breaker or opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failures=5, reset_after=30.0):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = self.CLOSED
+        self.opened = 0  # times the breaker has opened
+        self._consecutive = 0
+        self._retry_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() >= self._retry_at:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def skip(self):
+        """The call allow() let through was not made after all (e.g. no rate-limit token)"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._consecutive = 0
+            self._probing = False
+
+    def record_failure(self, retry_after=None):
+        """A failed call; retry_after (e.g. from a 429) opens the breaker for that long straight away"""
+        with self._lock:
+            self._consecutive += 1
+            if retry_after is not None or self.state == self.HALF_OPEN or self._consecutive >= self.failures:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self._retry_at = time.monotonic() + (retry_after if retry_after is not None else self.reset_after)
+                self._probing = False
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average with bursts of up to `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """
+        Take a token, returning how many seconds the caller must wait before using it,
+        or None (taking nothing) if that would be longer than max_wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def acquire(self, max_wait):
+        """Blocking reserve(); False if no token was available within max_wait"""
+        wait = self.reserve(max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
@@ -0,0 +1,58 @@
+"""
+In-process LRU cache for computed recommendation responses.
+
+Entries are keyed by whatever identifies a ranking (resolved row, k, offset,
+mode) and tagged with the artifact version they were computed from. The
+cache holds one version at a time: activate() (called when a version is
+swapped in) drops every entry, and requests still draining on a replaced
+version simply miss instead of evicting the new version's entries.
+"""
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """Thread-safe, size-capped LRU of responses for one artifact version at a time"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def activate(self, version):
+        """Serve version from now on, dropping entries of any other one"""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def get(self, version, key):
+        """Cached value for key under version, or None (always None for a version that isn't active)"""
+        with self._lock:
+            value = self._entries.get(key) if version == self.version else None
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, version, key, value):
+        with self._lock:
+            # A request still finishing on a replaced version must not evict the active one's entries
+            if version != self.version:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
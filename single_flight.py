@@ -0,0 +1,62 @@
+"""
+Request coalescing ("single flight") for identical concurrent work.
+
+When many callers miss a cache for the same key at once, only the first one
+runs the computation; the rest wait for it and receive the same result (or
+the same exception). Nothing is remembered after the call finishes, so this
+complements the caches in front of it rather than replacing them.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Thread-based coalescing: concurrent do() calls with equal keys share one fn() call"""
+
+    def __init__(self):
+        self.shared = 0  # calls answered by another caller's execution
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """Coalescing for coroutines on one event loop"""
+
+    def __init__(self):
+        self.shared = 0
+        self._tasks = {}
+
+    async def do(self, key, fn, *args):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args))
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._tasks.pop(key, None))
+        else:
+            self.shared += 1
+        # A caller that is cancelled (e.g. a client disconnect) must not cancel the shared task
+        return await asyncio.shield(task)
@@ -0,0 +1,193 @@
+"""
+In-memory title index for autocomplete and title lookup.
+
+Built once at load time from the catalog's titles:
+
+* a sorted array of lowercased titles, so prefix queries are two bisects;
+* an inverted index from every lowercased character 1-, 2- and 3-gram to the
+  rows containing it, so substring queries only verify the rows listed under
+  the query's rarest gram instead of scanning the whole catalog.
+
+Results are ranked exact match first, then prefix matches, then other
+substring matches, each group in catalog order.
+
+resolve() maps free-text input to a single row: an O(1) dict hit on the
+normalized title, else the title containing the input that is closest to it
+in length, else a fuzzy match ranked by shared trigrams and then
+edit-distance ratio.
+"""
+import heapq
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from difflib import SequenceMatcher
+
+MAX_GRAM = 3
+# Prefixes this short can match a large slice of the catalog, so their results are memoized
+# (only ones that match something, in an LRU capped at SHORT_PREFIX_CACHE_SIZE entries)
+SHORT_PREFIX = 2
+SHORT_PREFIX_CACHE_SIZE = 4096
+
+# Fuzzy matching: how many trigram-overlap candidates to rescore, and the minimum score to accept
+FUZZY_CANDIDATES = 50
+FUZZY_MIN_SCORE = 0.6
+
+Match = namedtuple('Match', ['row', 'title', 'match_type', 'score'])
+
+
+def normalize(title):
+    """Lowercase and collapse whitespace"""
+    return " ".join(str(title).lower().split())
+
+
+def words(text):
+    """Set of word tokens, ignoring punctuation"""
+    return frozenset(re.findall(r"\w+", text))
+
+
+def grams(text, n):
+    """All character n-grams of text (the text itself if shorter than n)"""
+    if len(text) <= n:
+        return [text]
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+class TitleIndex:
+    """Prefix and substring search over a fixed list of titles"""
+
+    def __init__(self, titles):
+        self.titles = list(titles)
+        self.normalized = [normalize(t) for t in self.titles]
+
+        self._words = [words(text) for text in self.normalized]
+
+        # First row wins when several movies share a title, like the old substring scan
+        self._exact = {}
+        for row, text in enumerate(self.normalized):
+            self._exact.setdefault(text, row)
+
+        order = sorted(range(len(self.normalized)), key=self.normalized.__getitem__)
+        self._sorted_keys = [self.normalized[row] for row in order]
+        self._sorted_rows = array('i', order)
+
+        postings = defaultdict(list)
+        for row, text in enumerate(self.normalized):
+            for n in range(1, MAX_GRAM + 1):
+                for gram in set(grams(text, n)):
+                    postings[gram].append(row)
+        # Rows are appended in increasing order, so every posting list is sorted
+        self._postings = {gram: array('i', rows) for gram, rows in postings.items()}
+        self._short_prefix_cache = OrderedDict()
+        self._short_prefix_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.titles)
+
+    def prefix_rows(self, query, limit):
+        """Rows whose title starts with query, exact match first, then catalog order"""
+        short = len(query) <= SHORT_PREFIX
+        if short:
+            with self._short_prefix_lock:
+                cached = self._short_prefix_cache.get((query, limit))
+                if cached is not None:
+                    self._short_prefix_cache.move_to_end((query, limit))
+                    return list(cached)
+
+        lo = bisect_left(self._sorted_keys, query)
+        hi = bisect_left(self._sorted_keys, query + "\U0010ffff", lo)
+        rows = self._sorted_rows[lo:hi]
+        rows = heapq.nsmallest(limit, rows, key=lambda row: (self.normalized[row] != query, row))
+        # Queries matching nothing are cheap (two bisects) and would let clients fill the cache with junk
+        if short and rows:
+            with self._short_prefix_lock:
+                self._short_prefix_cache[query, limit] = tuple(rows)
+                while len(self._short_prefix_cache) > SHORT_PREFIX_CACHE_SIZE:
+                    self._short_prefix_cache.popitem(last=False)
+        return rows
+
+    def substring_rows(self, query):
+        """Rows whose title contains query, in catalog order (generator)"""
+        n = min(MAX_GRAM, len(query))
+        candidates = None
+        for gram in grams(query, n):
+            posting = self._postings.get(gram)
+            if posting is None:
+                return
+            if candidates is None or len(posting) < len(candidates):
+                candidates = posting
+        for row in candidates:
+            if query in self.normalized[row]:
+                yield row
+
+    def fuzzy_rows(self, query, limit=1):
+        """
+        Up to limit (row, score) pairs for titles that look like query, best first.
+        Candidates share the most trigrams with the query; they are then ranked by
+        the better of the edit-distance ratio and the word overlap.
+        """
+        postings = [self._postings[g] for g in set(grams(query, MAX_GRAM)) if g in self._postings]
+        # Grams like "the" appear in a large share of titles and say little; skip them if rarer ones exist
+        rare = [p for p in postings if len(p) * 4 <= len(self.titles)]
+        shared = Counter()
+        for posting in rare or postings:
+            shared.update(posting)
+        if not shared:
+            return []
+
+        query_words = words(query)
+        scored = []
+        for row, _ in shared.most_common(FUZZY_CANDIDATES):
+            text = self.normalized[row]
+            ratio = SequenceMatcher(None, query, text, autojunk=False).ratio()
+            title_words = self._words[row]
+            overlap = 0.0
+            if query_words:
+                # Average of how much of the query is covered and plain Jaccard overlap
+                common = len(query_words & title_words)
+                overlap = (common / len(query_words) + common / len(query_words | title_words)) / 2
+            scored.append((max(ratio, overlap), row))
+
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(row, score) for score, row in scored[:limit] if score >= FUZZY_MIN_SCORE]
+
+    def resolve(self, query):
+        """Best single Match for free-text input, or None"""
+        query = normalize(query)
+        if not query:
+            return None
+
+        row = self._exact.get(query)
+        if row is not None:
+            return Match(row, self.titles[row], 'exact', 1.0)
+
+        # Of the titles containing the query, the shortest is the closest match ("dark knight" is
+        # "The Dark Knight", not an earlier "The Dark Knight Rises"); then prefix matches, then catalog order
+        row = min(self.substring_rows(query), default=None,
+                  key=lambda row: (len(self.normalized[row]), not self.normalized[row].startswith(query), row))
+        if row is not None:
+            # SequenceMatcher's ratio for a title containing the query
+            score = 2 * len(query) / (len(query) + len(self.normalized[row]))
+            return Match(row, self.titles[row], 'substring', round(score, 3))
+
+        fuzzy = self.fuzzy_rows(query)
+        if fuzzy:
+            row, score = fuzzy[0]
+            return Match(row, self.titles[row], 'fuzzy', round(score, 3))
+        return None
+
+    def search(self, query, limit=20):
+        """Up to limit row positions matching query, best first"""
+        query = normalize(query)
+        if not query or limit <= 0:
+            return []
+
+        rows = self.prefix_rows(query, limit)
+        if len(rows) < limit:
+            for row in self.substring_rows(query):
+                if not self.normalized[row].startswith(query):
+                    rows.append(row)
+                    if len(rows) == limit:
+                        break
+        return rows
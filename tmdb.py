@@ -0,0 +1,370 @@
+"""
+TMDB client used to enrich recommendations with posters and ratings.
+
+All lookups share one keep-alive requests.Session, and fetch_many() runs a
+page of lookups concurrently under a single time budget so a slow TMDB
+response can no longer hold a worker for 5 s per movie. Successful lookups
+are kept in a persistent cache so popular titles skip the network entirely.
+
+The async serving mode (asgi.py) uses the *_async variants instead, which
+share one aiohttp.ClientSession so hundreds of lookups can wait on TMDB from
+a single event loop without holding a thread each. (aiohttp rather than
+httpx: with a few hundred lookups in flight httpx's connection pool spent
+over ten times longer per batch in local measurements.)
+
+Both paths go through the same guards (see resilience.py): the per-call
+timeout follows recent TMDB latency instead of waiting out TMDB_TIMEOUT, a
+token bucket keeps us under TMDB's rate limit, and a circuit breaker stops
+calling TMDB after repeated timeouts, 5xx or 429 responses. While it is
+open, lookups answer at once from the cache (expired entries included) or
+with the placeholder.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # only needed for the async serving mode
+    aiohttp = None
+
+from metadata_cache import MetadataCache, DEFAULT_TTL
+from resilience import CircuitBreaker, LatencyTracker, TokenBucket
+from single_flight import AsyncSingleFlight, SingleFlight
+
+# Base URL of the TMDB API; point it at fake_tmdb.py for load tests, CI and offline development
+TMDB_API_URL = os.getenv("TMDB_API_URL", "https://api.themoviedb.org/3")
+TMDB_IMAGE_URL = "https://image.tmdb.org/t/p/w500/"
+
+POSTER_MISSING = "https://via.placeholder.com/500x750?text=No+Poster"
+POSTER_ERROR = "https://via.placeholder.com/500x750?text=Error+Loading"
+
+# Per-call socket timeout and the total wall-clock budget for one fetch_many() call
+TMDB_TIMEOUT = float(os.getenv("TMDB_TIMEOUT", "5"))
+TMDB_TIME_BUDGET = float(os.getenv("TMDB_TIME_BUDGET", "2.5"))
+TMDB_MAX_WORKERS = int(os.getenv("TMDB_MAX_WORKERS", "16"))
+# Connections the async session keeps to TMDB, shared by every in-flight request of the process
+TMDB_ASYNC_CONNECTIONS = int(os.getenv("TMDB_ASYNC_CONNECTIONS", "100"))
+
+# Per-call timeout: this percentile of recent TMDB latencies times TMDB_TIMEOUT_MARGIN, between
+# TMDB_MIN_TIMEOUT and TMDB_TIMEOUT
+TMDB_TIMEOUT_PERCENTILE = float(os.getenv("TMDB_TIMEOUT_PERCENTILE", "99"))
+TMDB_TIMEOUT_MARGIN = float(os.getenv("TMDB_TIMEOUT_MARGIN", "2"))
+TMDB_MIN_TIMEOUT = float(os.getenv("TMDB_MIN_TIMEOUT", "0.25"))
+# Consecutive failures that open the circuit breaker, and how long it stays open
+TMDB_BREAKER_FAILURES = int(os.getenv("TMDB_BREAKER_FAILURES", "5"))
+TMDB_BREAKER_RESET = float(os.getenv("TMDB_BREAKER_RESET", "30"))
+# Requests per second (per process) and burst size; TMDB allows about 50/s per IP
+TMDB_RATE_LIMIT = float(os.getenv("TMDB_RATE_LIMIT", "40"))
+TMDB_RATE_BURST = float(os.getenv("TMDB_RATE_BURST", "40"))
+
+# Shared on-disk cache of TMDB lookups, see metadata_cache.py
+TMDB_CACHE_PATH = os.getenv(
+    "TMDB_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tmdb_cache.sqlite3"))
+TMDB_CACHE_TTL = float(os.getenv("TMDB_CACHE_TTL", DEFAULT_TTL))
+
+cache = MetadataCache(TMDB_CACHE_PATH, ttl=TMDB_CACHE_TTL)
+
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=TMDB_MAX_WORKERS))
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=TMDB_MAX_WORKERS))
+
+executor = ThreadPoolExecutor(max_workers=TMDB_MAX_WORKERS, thread_name_prefix="tmdb")
+
+latency = LatencyTracker(TMDB_TIMEOUT, minimum=TMDB_MIN_TIMEOUT,
+                         percentile=TMDB_TIMEOUT_PERCENTILE, margin=TMDB_TIMEOUT_MARGIN)
+breaker = CircuitBreaker(failures=TMDB_BREAKER_FAILURES, reset_after=TMDB_BREAKER_RESET)
+rate_limit = TokenBucket(TMDB_RATE_LIMIT, TMDB_RATE_BURST)
+
+# Concurrent cache misses for the same movie share one TMDB request (see single_flight.py)
+lookups = SingleFlight()
+async_lookups = AsyncSingleFlight()
+
+# Created by open_async_client() when the ASGI app starts; an aiohttp.ClientSession
+async_client = None
+# Lookups that outlived their request's budget; kept referenced so they can finish and fill the cache
+_background_lookups = set()
+
+
+def request_metadata(movie_id, timeout=TMDB_TIMEOUT):
+    """
+    Fetch the raw (poster_path, vote_average) for one movie from TMDB.
+    Raises on a missing API key or any HTTP error.
+    """
+    # Get API key from environment variable
+    TMDB_API_KEY = os.getenv("TMDB_API_KEY")
+    if not TMDB_API_KEY:
+        raise ValueError("TMDB_API_KEY environment variable not set.")
+
+    url = f"{TMDB_API_URL}/movie/{movie_id}"
+    params = {'api_key': TMDB_API_KEY, 'language': 'en-US'}
+    response = session.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    return data.get('poster_path'), data.get('vote_average')
+
+
+def format_metadata(poster_path, vote_average):
+    """Turn raw TMDB fields into the (poster_url, rating) pair the API returns"""
+    full_path = TMDB_IMAGE_URL + poster_path if poster_path else POSTER_MISSING
+    rating = vote_average if vote_average is not None else 'N/A'
+    return full_path, rating
+
+
+def fallback_metadata(movie_id):
+    """What to show when TMDB can't be asked: an expired cache entry if there is one, else the placeholder"""
+    cached = cache.get(movie_id, stale=True)
+    if cached is not None:
+        return format_metadata(*cached)
+    return POSTER_ERROR, "N/A"
+
+
+def retry_after(value):
+    """Seconds from a Retry-After header, or None if it is missing or a date"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def record_http_error(status, headers):
+    """Tell the breaker about an error response: 429 and 5xx mean TMDB is unhealthy, other 4xx don't"""
+    if status == 429:
+        breaker.record_failure(retry_after(headers.get('Retry-After')) or 1.0)
+    elif status >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def status():
+    """Health of the TMDB client, for /api/version"""
+    return {
+        'breaker': breaker.state,
+        'breaker_opened': breaker.opened,
+        'timeout': round(latency.timeout(), 3),
+    }
+
+
+def fetch_poster_and_rating(movie_id, timeout=TMDB_TIMEOUT):
+    """
+    Fetch poster and rating, from the local cache when fresh, otherwise from TMDB.
+    Returns a tuple: (poster_url, rating)
+    """
+    cached = cache.get(movie_id)
+    if cached is not None:
+        return format_metadata(*cached)
+    return lookups.do(movie_id, lookup_metadata, movie_id, timeout)
+
+
+def lookup_metadata(movie_id, timeout=TMDB_TIMEOUT):
+    """
+    The TMDB request behind a cache miss; stores successes and falls back to
+    fallback_metadata() on errors, an open breaker or no rate-limit token in time.
+    """
+    if not breaker.allow():
+        return fallback_metadata(movie_id)
+    # Wait for a rate-limit token only as long as still leaves time for the call itself
+    call_timeout = min(timeout, latency.timeout())
+    if not rate_limit.acquire(timeout - call_timeout):
+        breaker.skip()
+        print(f"TMDB rate limit reached, not looking up movie_id {movie_id}")
+        return fallback_metadata(movie_id)
+
+    started = time.monotonic()
+    try:
+        poster_path, vote_average = request_metadata(movie_id, call_timeout)
+        latency.record(time.monotonic() - started)
+        breaker.record_success()
+        cache.put(movie_id, poster_path, vote_average)
+        return format_metadata(poster_path, vote_average)
+
+    except requests.exceptions.HTTPError as http_err:
+        latency.record(time.monotonic() - started)
+        record_http_error(http_err.response.status_code, http_err.response.headers)
+        print(f"HTTP error occurred for movie_id {movie_id}: {http_err}")
+    except requests.exceptions.RequestException as req_err:
+        # Timeouts count at the timeout, so a TMDB that got slower raises the adaptive timeout again
+        latency.record(time.monotonic() - started)
+        breaker.record_failure()
+        print(f"Request error for movie_id {movie_id}: {req_err}")
+    except Exception as e:
+        breaker.skip()
+        print(f"Error fetching data for movie_id {movie_id}: {e}")
+
+    # Fallback values if error occurs (not cached, so the next request retries)
+    return fallback_metadata(movie_id)
+
+
+def fetch_as_completed(movie_ids, budget=TMDB_TIME_BUDGET):
+    """
+    Yield (position, (poster_url, rating)) for each id as soon as its lookup finishes.
+    Lookups still running when the budget expires are yielded last, with placeholder values.
+    """
+    timeout = min(TMDB_TIMEOUT, budget)
+    futures = {executor.submit(fetch_poster_and_rating, movie_id, timeout): position
+               for position, movie_id in enumerate(movie_ids)}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=budget):
+            pending.discard(future)
+            yield futures[future], future.result()
+    except FuturesTimeout:
+        print(f"TMDB budget of {budget}s exceeded for {len(pending)} of {len(futures)} lookups")
+    for future in sorted(pending, key=futures.get):
+        yield futures[future], (POSTER_ERROR, "N/A")
+
+
+def fetch_many(movie_ids, budget=TMDB_TIME_BUDGET):
+    """
+    Fetch (poster_url, rating) for every id concurrently, in input order.
+    Lookups still running when the budget expires get placeholder values.
+    """
+    timeout = min(TMDB_TIMEOUT, budget)
+    futures = [executor.submit(fetch_poster_and_rating, movie_id, timeout) for movie_id in movie_ids]
+    done, not_done = wait(futures, timeout=budget)
+    if not_done:
+        print(f"TMDB budget of {budget}s exceeded for {len(not_done)} of {len(futures)} lookups")
+
+    return [f.result() if f in done else (POSTER_ERROR, "N/A") for f in futures]
+
+
+def open_async_client():
+    """Create the shared session for the *_async functions; call it from the event loop that will use it"""
+    global async_client
+    if aiohttp is None:
+        raise RuntimeError("The async serving mode needs aiohttp (pip install aiohttp)")
+    connector = aiohttp.TCPConnector(limit=TMDB_ASYNC_CONNECTIONS, ttl_dns_cache=300)
+    async_client = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=TMDB_TIMEOUT))
+    return async_client
+
+
+async def close_async_client():
+    global async_client
+    if async_client is not None:
+        await async_client.close()
+        async_client = None
+
+
+async def request_metadata_async(movie_id, timeout=TMDB_TIMEOUT):
+    """request_metadata() on the shared async client"""
+    TMDB_API_KEY = os.getenv("TMDB_API_KEY")
+    if not TMDB_API_KEY:
+        raise ValueError("TMDB_API_KEY environment variable not set.")
+
+    url = f"{TMDB_API_URL}/movie/{movie_id}"
+    params = {'api_key': TMDB_API_KEY, 'language': 'en-US'}
+    async with async_client.get(url, params=params, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        response.raise_for_status()
+        data = await response.json()
+    return data.get('poster_path'), data.get('vote_average')
+
+
+async def cached_metadata_async(movie_id, stale=False):
+    """
+    cache.get() for the event loop: in-memory LRU hits are answered inline, SQLite reads
+    run in the executor (a write lock held by another worker could stall the loop for seconds)
+    """
+    cached = cache.peek(movie_id, stale)
+    if cached is None:
+        cached = await asyncio.get_running_loop().run_in_executor(executor, cache.get, movie_id, stale)
+    return cached
+
+
+async def fallback_metadata_async(movie_id):
+    """fallback_metadata() without touching SQLite on the event loop"""
+    cached = await cached_metadata_async(movie_id, stale=True)
+    if cached is not None:
+        return format_metadata(*cached)
+    return POSTER_ERROR, "N/A"
+
+
+async def fetch_poster_and_rating_async(movie_id, timeout=TMDB_TIMEOUT):
+    """fetch_poster_and_rating() without blocking the event loop on the network or on SQLite"""
+    cached = await cached_metadata_async(movie_id)
+    if cached is not None:
+        return format_metadata(*cached)
+    return await async_lookups.do(movie_id, lookup_metadata_async, movie_id, timeout)
+
+
+async def lookup_metadata_async(movie_id, timeout=TMDB_TIMEOUT):
+    """lookup_metadata() on the shared async session"""
+    if not breaker.allow():
+        return await fallback_metadata_async(movie_id)
+    call_timeout = min(timeout, latency.timeout())
+    wait = rate_limit.reserve(timeout - call_timeout)
+    if wait is None:
+        breaker.skip()
+        print(f"TMDB rate limit reached, not looking up movie_id {movie_id}")
+        return await fallback_metadata_async(movie_id)
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+    started = time.monotonic()
+    try:
+        poster_path, vote_average = await request_metadata_async(movie_id, call_timeout)
+        latency.record(time.monotonic() - started)
+        breaker.record_success()
+        # Written in the background: the response doesn't need to wait for SQLite
+        asyncio.get_running_loop().run_in_executor(executor, cache.put, movie_id, poster_path, vote_average)
+        return format_metadata(poster_path, vote_average)
+    except aiohttp.ClientResponseError as http_err:
+        latency.record(time.monotonic() - started)
+        record_http_error(http_err.status, http_err.headers or {})
+        print(f"HTTP error occurred for movie_id {movie_id}: {http_err}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as req_err:
+        latency.record(time.monotonic() - started)
+        breaker.record_failure()
+        print(f"Request error for movie_id {movie_id}: {req_err!r}")
+    except Exception as e:
+        breaker.skip()
+        print(f"Error fetching data for movie_id {movie_id}: {e}")
+
+    return await fallback_metadata_async(movie_id)
+
+
+async def fetch_many_async(movie_ids, budget=TMDB_TIME_BUDGET):
+    """fetch_many() as concurrent tasks on the event loop"""
+    if not movie_ids:
+        return []
+    timeout = min(TMDB_TIMEOUT, budget)
+    tasks = [asyncio.ensure_future(fetch_poster_and_rating_async(movie_id, timeout)) for movie_id in movie_ids]
+    done, not_done = await asyncio.wait(tasks, timeout=budget)
+    if not_done:
+        print(f"TMDB budget of {budget}s exceeded for {len(not_done)} of {len(tasks)} lookups")
+        for task in not_done:
+            _background_lookups.add(task)
+            task.add_done_callback(_background_lookups.discard)
+
+    return [task.result() if task in done else (POSTER_ERROR, "N/A") for task in tasks]
+
+
+async def fetch_as_completed_async(movie_ids, budget=TMDB_TIME_BUDGET):
+    """fetch_as_completed() as concurrent tasks on the event loop (an async generator)"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + budget
+    timeout = min(TMDB_TIMEOUT, budget)
+    tasks = {asyncio.ensure_future(fetch_poster_and_rating_async(movie_id, timeout)): position
+             for position, movie_id in enumerate(movie_ids)}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print(f"TMDB budget of {budget}s exceeded for {len(pending)} of {len(tasks)} lookups")
+                break
+            for task in sorted(done, key=tasks.get):
+                yield tasks[task], task.result()
+        for task in sorted(pending, key=tasks.get):
+            yield tasks[task], (POSTER_ERROR, "N/A")
+    finally:
+        # Let unfinished lookups fill the cache, even if the client went away
+        for task in pending:
+            if not task.done():
+                _background_lookups.add(task)
+                task.add_done_callback(_background_lookups.discard)
@@ -0,0 +1,93 @@
+"""
+Sparse tag vectors and on-demand cosine similarity.
+
+Instead of the notebook's dense CountVectorizer output and N x N
+cosine_similarity matrix, the bundle stores the L2-normalized tag vectors as
+the three arrays of a CSR matrix:
+
+    vectors_data.npy     float32 (nnz,)  normalized term weights
+    vectors_indices.npy  int32   (nnz,)  vocabulary column of each weight
+    vectors_indptr.npy   int64   (N+1,)  row boundaries
+    vocabulary.json      list of terms, column order
+
+Because rows are unit length, one row of cosine similarities is a single
+sparse mat-vec, O(nnz) time and memory, so the catalog can grow far past the
+point where an N x N matrix fits in RAM.
+"""
+import numpy as np
+from scipy import sparse
+
+# Matches the notebook's CountVectorizer settings
+MAX_FEATURES = 5000
+STOP_WORDS = 'english'
+
+
+def l2_normalize(matrix):
+    """Return a float32 CSR copy of matrix with unit-length rows (empty rows stay empty)"""
+    matrix = sparse.csr_matrix(matrix, dtype=np.float32, copy=True)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    matrix.data /= np.repeat(norms, np.diff(matrix.indptr)).astype(np.float32)
+    return matrix
+
+
+def vectorize_tags(tags, max_features=MAX_FEATURES):
+    """Fit a CountVectorizer on the tag strings; returns (normalized CSR matrix, vocabulary list)"""
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    vectorizer = CountVectorizer(max_features=max_features, stop_words=STOP_WORDS)
+    counts = vectorizer.fit_transform(tags)
+    return l2_normalize(counts), vectorizer.get_feature_names_out().tolist()
+
+
+def vectorize_with_vocabulary(tags, vocabulary):
+    """Vectorize tag strings against an existing (frozen) vocabulary; returns a normalized CSR matrix"""
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    vectorizer = CountVectorizer(vocabulary=vocabulary, stop_words=STOP_WORDS)
+    return l2_normalize(vectorizer.transform(tags))
+
+
+def bundle_arrays(matrix):
+    """The CSR arrays to store in an artifact bundle"""
+    return {
+        'vectors_data': matrix.data.astype(np.float32),
+        'vectors_indices': matrix.indices.astype(np.int32),
+        'vectors_indptr': matrix.indptr.astype(np.int64),
+    }
+
+
+class SparseVectors:
+    """Read-only view of the bundle's normalized tag vectors"""
+
+    def __init__(self, data, indices, indptr, num_features):
+        shape = (len(indptr) - 1, num_features)
+        self.matrix = sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+    @classmethod
+    def from_artifacts(cls, artifacts):
+        return cls(artifacts.get('vectors_data'), artifacts.get('vectors_indices'),
+                   artifacts.get('vectors_indptr'), len(artifacts.get('vocabulary')))
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def row(self, index):
+        """Dense copy of one normalized vector"""
+        return self.matrix[index].toarray().ravel()
+
+    def similarities(self, index):
+        """Cosine similarity of row `index` against every row"""
+        return self.matrix.dot(self.row(index))
+
+    def similarities_many(self, indices):
+        """Dense (len(indices), N) block of cosine similarities for several rows"""
+        indices = np.atleast_1d(indices)
+        if len(indices) == 1:
+            return self.similarities(indices[0])[np.newaxis, :]
+        # CSR @ (small CSR).T keeps the big matrix in place; matrix.T would re-transpose all of it per call
+        return (self.matrix @ self.matrix[indices].T).T.toarray()
+
+    def similarities_to(self, vector):
+        """Cosine similarity of an arbitrary unit-length dense vector against every row"""
+        return self.matrix.dot(vector)